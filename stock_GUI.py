@@ -2,24 +2,198 @@
 
 from datetime import datetime
 from os import path
+import queue
+import threading
 from tkinter import *
 from tkinter import ttk
 from tkinter import messagebox, simpledialog, filedialog
 import csv
 import stock_data
-from stock_class import Stock, DailyData
-from utilities import clear_screen, display_stock_chart, sortStocks, sortDailyData
+from stock_class import Stock, DailyData, Portfolio
+from utilities import clear_screen, sortStocks, sortDailyData
+
+class JobRunner:
+    """
+    Runs one job at a time on a background thread so the Tk main loop
+    stays responsive. work(job) runs on the thread and hands results to
+    the main thread with job.post(...); the queue is polled with
+    root.after() and each message is passed to on_message, then the
+    return value to on_done or the exception to on_error.
+    cancel() only sets a flag, work() checks job.cancelled and stops.
+    """
+    def __init__(self, root, poll_ms=50, max_messages=50):
+        self._root = root
+        self._poll_ms = poll_ms
+        self._max_messages = max_messages
+        self._queue = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+        self._handlers = (None, None, None)
+
+    @property
+    def busy(self):
+        return self._thread is not None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def start(self, work, on_message=None, on_done=None, on_error=None):
+        if self.busy:
+            raise RuntimeWarning("Job Already Running")
+        self._cancel.clear()
+        self._handlers = (on_message, on_done, on_error)
+
+        def run():
+            try:
+                self._queue.put(("done", work(self)))
+            except Exception as e:
+                self._queue.put(("error", e))
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._root.after(self._poll_ms, self._poll)
+
+    def post(self, *message):
+        self._queue.put(("message", message))
+
+    def cancel(self):
+        self._cancel.set()
+
+    # Deliver queued messages on the main thread, a few at a time so drawing keeps up
+    def _poll(self):
+        on_message, on_done, on_error = self._handlers
+        for _ in range(self._max_messages):
+            try:
+                kind, value = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "message":
+                if on_message is not None:
+                    on_message(*value)
+                continue
+            self._thread = None
+            if kind == "done" and on_done is not None:
+                on_done(value)
+            elif kind == "error" and on_error is not None:
+                on_error(value)
+            return
+        self._root.after(self._poll_ms, self._poll)
+
+class HistoryView(Frame):
+    """
+    Virtualised table of a stock's daily data. The Treeview only holds
+    as many rows as fit on screen and scrolling refills them from the
+    series, formatting just the rows shown. Formatted rows are cached
+    per symbol until the series version changes, for up to cache_size
+    symbols, so switching back to a large stock costs nothing.
+    """
+    COLUMNS = (("date", "Date", 80, W), ("close", "Price", 90, E),
+               ("volume", "Volume", 110, E), ("entered", "Entered", 130, W))
+
+    def __init__(self, master, cache_size=32):
+        Frame.__init__(self, master)
+        self._cache = {} # symbol -> (series version, formatted rows by index)
+        self._cache_size = cache_size
+        self._symbol = None
+        self._series = None
+        self._rows = []
+        self._top = 0 # index of the first row shown
+        self._items = [] # Treeview rows, reused for whatever is in view
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in self.COLUMNS], show="headings", selectmode="none")
+        for name, heading, width, anchor in self.COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, anchor=anchor)
+        self.scrollbar = ttk.Scrollbar(self, orient=VERTICAL, command=self._scroll)
+        self.scrollbar.pack(side=RIGHT, fill=Y)
+        self.tree.pack(side=LEFT, fill=BOTH, expand=True)
+        self.tree.bind("<Configure>", self._resize)
+        self.tree.bind("<MouseWheel>", lambda e: self._move(-3 if e.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda e: self._move(-3))
+        self.tree.bind("<Button-5>", lambda e: self._move(3))
+
+    # Show the daily data of a stock, keeping the scroll position when it is shown again
+    def show(self, symbol, series):
+        cached = self._cache.pop(symbol, None)
+        if cached is None or cached[0] != series.version:
+            cached = (series.version, [None] * len(series))
+        self._cache[symbol] = cached
+        while len(self._cache) > self._cache_size:
+            # least recently shown first
+            del self._cache[next(iter(self._cache))]
+        if symbol != self._symbol:
+            self._top = 0
+        self._symbol = symbol
+        self._series = series
+        self._rows = cached[1]
+        self._render()
+
+    def clear(self):
+        self._symbol = None
+        self._series = None
+        self._rows = []
+        self._top = 0
+        self._render()
+
+    def _row(self, i):
+        row = self._rows[i]
+        if row is None:
+            daily_data = self._series[i]
+            entered = ''
+            if daily_data.entered:
+                try:
+                    entered = daily_data.entered.strftime("%m/%d/%y %H:%M:%S")
+                except Exception:
+                    entered = str(daily_data.entered)
+            row = (daily_data.date.strftime("%m/%d/%y"), f"${daily_data.close:0,.2f}",
+                   f"{daily_data.volume:0,.0f}", entered)
+            self._rows[i] = row
+        return row
+
+    def _render(self):
+        total = len(self._rows)
+        visible = len(self._items)
+        self._top = max(0, min(self._top, total - visible))
+        for k, item in enumerate(self._items):
+            i = self._top + k
+            self.tree.item(item, values=self._row(i) if i < total else ())
+        if total:
+            self.scrollbar.set(self._top / total, min(1.0, (self._top + visible) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    # Keep one Treeview row per line that fits in the widget
+    def _resize(self, event):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # one line goes to the headings
+        visible = max(1, event.height // rowheight - 1)
+        while len(self._items) < visible:
+            self._items.append(self.tree.insert('', END))
+        while len(self._items) > visible:
+            self.tree.delete(self._items.pop())
+        self._render()
+
+    def _scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self._top = int(float(amount) * len(self._rows))
+            self._render()
+        else:
+            self._move(int(amount) * (len(self._items) if unit == "pages" else 1))
+
+    def _move(self, rows):
+        self._top += rows
+        self._render()
 
 class StockApp:
     def __init__(self):
-        self.stock_list = []
+        self.stock_list = Portfolio()
         #check for database, create if not exists
         if path.exists("stocks.db") == False:
             stock_data.create_database()
         else:
-            # Load existing data from database on startup
+            # Load existing stocks on startup, daily data is read when a stock is viewed
             try:
-                stock_data.load_stock_data(self.stock_list)
+                stock_data.load_stock_data(self.stock_list, lazy=True)
                 sortStocks(self.stock_list)
             except Exception:
                 # If load fails, continue with empty list
@@ -29,6 +203,7 @@ class StockApp:
         self.root = Tk()
         self.root.title("Stock Manager")
         self.root.geometry("900x600")
+        self.jobs = JobRunner(self.root)
 
         # Add Menubar
         self.menubar = Menu(self.root)
@@ -46,12 +221,18 @@ class StockApp:
         web_menu = Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label="Web", menu=web_menu)
         web_menu.add_command(label="Scrape Yahoo Finance", command=self.scrape_web_data)
+        web_menu.add_command(label="Refresh Yahoo Finance (New Data)", command=self.refresh_web_data)
         web_menu.add_command(label="Import CSV", command=self.importCSV_web_data)
+        web_menu.add_command(label="Import CSV Folder", command=self.importCSV_folder)
 
         # Chart Menu
         chart_menu = Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label="Chart", menu=chart_menu)
         chart_menu.add_command(label="Display Chart", command=self.display_chart)
+        chart_menu.add_command(label="Compare Performance", command=self.display_performance_chart)
+        chart_menu.add_command(label="Portfolio Value", command=self.display_portfolio_chart)
+        chart_menu.add_separator()
+        chart_menu.add_command(label="Export Charts", command=self.export_charts)
 
         # Add heading information
         heading_frame = Frame(self.root)
@@ -59,6 +240,16 @@ class StockApp:
         self.headingLabel = Label(heading_frame, text="Stock Manager", font=("Arial", 14, "bold"))
         self.headingLabel.pack()
 
+        # Status bar: background job progress
+        status_frame = Frame(self.root)
+        status_frame.pack(side=BOTTOM, fill=X, padx=10, pady=(0, 5))
+        self.cancelButton = Button(status_frame, text="Cancel", command=self.cancel_job, state=DISABLED)
+        self.cancelButton.pack(side=RIGHT)
+        self.progress = ttk.Progressbar(status_frame, length=200)
+        self.progress.pack(side=RIGHT, padx=5)
+        self.statusLabel = Label(status_frame, text="", anchor=W)
+        self.statusLabel.pack(side=LEFT, fill=X, expand=True)
+
         # Main content frame
         content_frame = Frame(self.root)
         content_frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
@@ -122,8 +313,8 @@ class StockApp:
         self.notebook.add(self.history_tab, text="History")
         
         Label(self.history_tab, text="Daily Stock Data", font=("Arial", 10, "bold")).pack(pady=5)
-        self.dailyDataList = Text(self.history_tab, height=20, width=50)
-        self.dailyDataList.pack(fill=BOTH, expand=True, padx=5, pady=5)
+        self.historyView = HistoryView(self.history_tab)
+        self.historyView.pack(fill=BOTH, expand=True, padx=5, pady=5)
 
         # Report Tab
         self.report_tab = Frame(self.notebook)
@@ -133,22 +324,103 @@ class StockApp:
         self.stockReport = Text(self.report_tab, height=20, width=50)
         self.stockReport.pack(fill=BOTH, expand=True, padx=5, pady=5)
 
+        # Chart Tab, the chart is created the first time it is shown and then reused
+        self.chart_tab = Frame(self.notebook)
+        self.notebook.add(self.chart_tab, text="Chart")
+        self.chartView = None
+        # symbol in the chart, None while it compares the portfolio
+        self.chartSymbol = None
+
         ## Call MainLoop
         self.root.mainloop()
        
-    # Load stocks and history from database.
-    def load(self):
+    # Run work(job) on the job runner. total is the number of progress steps,
+    # 0 shows a busy bar. on_message and on_done run on the main thread.
+    def start_job(self, title, total, work, on_message=None, on_done=None, cancellable=True):
+        if self.jobs.busy:
+            messagebox.showwarning(title,"Please wait for the running job to finish")
+            return
+        if total:
+            self.progress.configure(mode="determinate", maximum=total, value=0)
+        else:
+            self.progress.configure(mode="indeterminate")
+            self.progress.start()
+        self.statusLabel['text'] = title + "..."
+        self.cancelButton['state'] = NORMAL if cancellable else DISABLED
+
+        def finish(status):
+            self.progress.stop()
+            self.progress.configure(mode="determinate", value=0)
+            self.cancelButton['state'] = DISABLED
+            self.statusLabel['text'] = title + " " + status
+
+        def done(result):
+            finish("cancelled" if self.jobs.cancelled else "done")
+            if on_done is not None:
+                on_done(result)
+
+        def failed(error):
+            finish("failed")
+            messagebox.showerror(title,"Error: " + str(error))
+
+        self.jobs.start(work, on_message, done, failed)
+
+    # Advance the job progress bar by one step.
+    def step_job(self, text):
+        self.progress['value'] = self.progress['value'] + 1
+        self.statusLabel['text'] = text
+
+    # Ask the running job to stop after the item in progress.
+    def cancel_job(self):
+        self.jobs.cancel()
+        self.cancelButton['state'] = DISABLED
+        self.statusLabel['text'] = "Cancelling..."
+
+    # Symbol selected in the stock list, None if nothing is selected.
+    def selected_symbol(self):
+        try:
+            return self.stockList.get(self.stockList.curselection())
+        except Exception:
+            return None
+
+    # Fill the stock list from the portfolio.
+    def refresh_stock_list(self):
+        selected = self.selected_symbol()
         self.stockList.delete(0,END)
-        stock_data.load_stock_data(self.stock_list)
-        sortStocks(self.stock_list)
-        for stock in self.stock_list:
+        for i, stock in enumerate(self.stock_list):
             self.stockList.insert(END,stock.symbol)
-        messagebox.showinfo("Load Data","Data Loaded")
+            if stock.symbol == selected:
+                self.stockList.selection_set(i)
+
+    # Load stocks and history from database.
+    def load(self):
+        def work(job):
+            loaded = Portfolio()
+            stock_data.load_stock_data(loaded, lazy=True)
+            return loaded
+
+        def done(loaded):
+            self.stock_list.clear()
+            for stock in loaded:
+                self.stock_list.append(stock)
+            sortStocks(self.stock_list)
+            self.refresh_stock_list()
+            messagebox.showinfo("Load Data","Data Loaded")
+
+        self.start_job("Load Data", 0, work, on_done=done, cancellable=False)
 
     # Save stocks and history to database.
     def save(self):
-        stock_data.save_stock_data(self.stock_list)
-        messagebox.showinfo("Save Data","Data Saved")
+        # copied here, edits made while the job runs cannot tear a row
+        snapshot = stock_data.stock_snapshot(self.stock_list)
+
+        def work(job):
+            return stock_data.save_stock_snapshot(snapshot)
+
+        def done(result):
+            messagebox.showinfo("Save Data","Data Saved\n" + str(result['inserted']) + " inserted, " + str(result['updated']) + " updated, " + str(result['skipped']) + " skipped")
+
+        self.start_job("Save Data", 0, work, on_done=done, cancellable=False)
 
     # Refresh history and report tabs
     def update_data(self, evt):
@@ -161,54 +433,45 @@ class StockApp:
         except Exception:
             # nothing selected
             return
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                self.headingLabel['text'] = stock.name + " - " + str(stock.shares) + " Shares"
-                self.dailyDataList.delete("1.0",END)
-                self.stockReport.delete("1.0",END)
-                self.dailyDataList.insert(END,"- Date -   - Price -   - Volume -\n")
-                self.dailyDataList.insert(END,"=================================\n")
-                for daily_data in stock.DataList:
-                    # show trading date and the entry timestamp
-                    trade_date = daily_data.date.strftime("%m/%d/%y")
-                    entered = ''
-                    if getattr(daily_data, 'entered', None):
-                        try:
-                            entered = daily_data.entered.strftime("%m/%d/%y %H:%M:%S")
-                        except Exception:
-                            entered = str(daily_data.entered)
-                    row = f"{trade_date}   ${daily_data.close:0,.2f}   {daily_data.volume}   (entered: {entered})\n"
-                    self.dailyDataList.insert(END, row)
-
-                # Display report
-                if stock.DataList:
-                    prices = [d.close for d in stock.DataList]
-                    volumes = [d.volume for d in stock.DataList]
-                    avg_price = sum(prices) / len(prices)
-                    min_price = min(prices)
-                    max_price = max(prices)
-                    total_volume = sum(volumes)
-                    self.stockReport.insert(END, f"Symbol: {stock.symbol}\n")
-                    self.stockReport.insert(END, f"Name: {stock.name}\n")
-                    self.stockReport.insert(END, f"Shares: {stock.shares}\n")
-                    # show last entry timestamp if available
+        stock = self.stock_list.get(symbol)
+        if stock is not None:
+            self.headingLabel['text'] = stock.name + " - " + str(stock.shares) + " Shares"
+            self.stockReport.delete("1.0",END)
+            self.historyView.show(stock.symbol, stock.DataList)
+            if self.chartSymbol is not None and self.notebook.select() == str(self.chart_tab):
+                self.chartView.show(stock.symbol + " - " + stock.name, stock.DataList)
+
+            # Display report
+            summary = stock.summary()
+            if summary["count"]:
+                self.stockReport.insert(END, f"Symbol: {stock.symbol}\n")
+                self.stockReport.insert(END, f"Name: {stock.name}\n")
+                self.stockReport.insert(END, f"Shares: {stock.shares}\n")
+                # show last entry timestamp if available
+                last_entered = ''
+                try:
+                    last_entered = summary["last"].entered.strftime("%m/%d/%y %H:%M:%S")
+                except Exception:
                     last_entered = ''
-                    try:
-                        last_entered = stock.DataList[-1].entered.strftime("%m/%d/%y %H:%M:%S")
-                    except Exception:
-                        last_entered = ''
-                    if last_entered:
-                        self.stockReport.insert(END, f"Last Entry: {last_entered}\n")
-                    self.stockReport.insert(END, f"\nPrice Statistics:\n")
-                    self.stockReport.insert(END, f"Average Price: ${avg_price:0.2f}\n")
-                    self.stockReport.insert(END, f"Min Price: ${min_price:0.2f}\n")
-                    self.stockReport.insert(END, f"Max Price: ${max_price:0.2f}\n")
-                    self.stockReport.insert(END, f"Total Volume: {total_volume:0.0f}\n")
-                else:
-                    self.stockReport.insert(END, f"Symbol: {stock.symbol}\n")
-                    self.stockReport.insert(END, f"Name: {stock.name}\n")
-                    self.stockReport.insert(END, f"Shares: {stock.shares}\n")
-                    self.stockReport.insert(END, f"\nNo data available\n")
+                if last_entered:
+                    self.stockReport.insert(END, f"Last Entry: {last_entered}\n")
+                self.stockReport.insert(END, f"\nPrice Statistics:\n")
+                self.stockReport.insert(END, f"Average Price: ${summary['average']:0.2f}\n")
+                self.stockReport.insert(END, f"Min Price: ${summary['min']:0.2f}\n")
+                self.stockReport.insert(END, f"Max Price: ${summary['max']:0.2f}\n")
+                self.stockReport.insert(END, f"Total Volume: {summary['volume']:0.0f}\n")
+                # streaming values, only bars added since the last report are processed
+                import stock_analytics
+                lines = stock_analytics.format_indicators(stock.indicators.values())
+                if lines:
+                    self.stockReport.insert(END, f"\nIndicators:\n")
+                    for line in lines:
+                        self.stockReport.insert(END, line + "\n")
+            else:
+                self.stockReport.insert(END, f"Symbol: {stock.symbol}\n")
+                self.stockReport.insert(END, f"Name: {stock.name}\n")
+                self.stockReport.insert(END, f"Shares: {stock.shares}\n")
+                self.stockReport.insert(END, f"\nNo data available\n")
 
 
                     
@@ -226,6 +489,9 @@ class StockApp:
         if not symbol:
             messagebox.showerror("Invalid Input","Symbol is required")
             return
+        if symbol in self.stock_list:
+            messagebox.showerror("Invalid Input",symbol + " is already tracked")
+            return
         new_stock = Stock(symbol, name, shares_val)
         self.stock_list.append(new_stock)
         idx = self.stockList.size()
@@ -252,11 +518,10 @@ class StockApp:
         except Exception:
             messagebox.showerror("Invalid Input","Shares must be a number")
             return
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                stock.buy(qty)
-                self.headingLabel['text'] = stock.name + " - " + str(stock.shares) + " Shares"
-                break
+        stock = self.stock_list.get(symbol)
+        if stock is not None:
+            stock.buy(qty)
+            self.headingLabel['text'] = stock.name + " - " + str(stock.shares) + " Shares"
         messagebox.showinfo("Buy Shares","Shares Purchased")
         self.updateSharesEntry.delete(0,END)
         self.display_stock_data()
@@ -273,11 +538,10 @@ class StockApp:
         except Exception:
             messagebox.showerror("Invalid Input","Shares must be a number")
             return
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                stock.sell(qty)
-                self.headingLabel['text'] = stock.name + " - " + str(stock.shares) + " Shares"
-                break
+        stock = self.stock_list.get(symbol)
+        if stock is not None:
+            stock.sell(qty)
+            self.headingLabel['text'] = stock.name + " - " + str(stock.shares) + " Shares"
         messagebox.showinfo("Sell Shares","Shares Sold")
         self.updateSharesEntry.delete(0,END)
         self.display_stock_data()
@@ -285,26 +549,25 @@ class StockApp:
     # Remove stock and all history from being tracked.
     def delete_stock(self):
        try:
-           symbol = self.stockList.get(self.stockList.curselection())
+           i = self.stockList.curselection()[0]
+           symbol = self.stockList.get(i)
        except Exception:
            messagebox.showwarning("Delete Stock","No stock selected")
            return
-       for i,stock in enumerate(self.stock_list):
-           if stock.symbol == symbol:
-               del self.stock_list[i]
-               self.stockList.delete(i)
-               self.dailyDataList.delete("1.0",END)
-               self.stockReport.delete("1.0",END)
-               self.headingLabel['text'] = ""
-               messagebox.showinfo("Delete Stock","Stock deleted")
-               # after deletion, select next item if available
-               size = self.stockList.size()
-               if size > 0:
-                   sel = i if i < size else size-1
-                   self.stockList.selection_set(sel)
-                   self.stockList.activate(sel)
-                   self.display_stock_data()
-               return
+       if self.stock_list.remove(symbol) is not None:
+           self.stockList.delete(i)
+           self.historyView.clear()
+           self.stockReport.delete("1.0",END)
+           self.headingLabel['text'] = ""
+           messagebox.showinfo("Delete Stock","Stock deleted")
+           # after deletion, select next item if available
+           size = self.stockList.size()
+           if size > 0:
+               sel = i if i < size else size-1
+               self.stockList.selection_set(sel)
+               self.stockList.activate(sel)
+               self.display_stock_data()
+           return
        messagebox.showwarning("Delete Stock","Stock not found")
 
     # Get data from web scraping.
@@ -318,13 +581,75 @@ class StockApp:
         dateTo = simpledialog.askstring("Ending Date","Enter Ending Date (m/d/yy)")
         if not dateFrom or not dateTo:
             return
+        symbols = self.stock_list.symbols()
+
+        def work(job):
+            with stock_data.PageCache() as cache, stock_data.DailyDataWriter(self.stock_list) as writer:
+                self.post_history(job, stock_data.fetch_stock_history(symbols, dateFrom, dateTo, cache=cache), writer)
+
+        self.start_history_job("Get Data From Web", symbols, work)
+
+    # Get only the days newer than the stored history of each stock.
+    def refresh_web_data(self):
+        symbols = self.stock_list.symbols()
+
+        def work(job):
+            with stock_data.PageCache() as cache, stock_data.DailyDataWriter(self.stock_list) as writer:
+                self.post_history(job, stock_data.refresh_stock_history(self.stock_list, cache=cache), writer)
+
+        self.start_history_job("Refresh From Web", symbols, work)
+
+    # Hand each (symbol, columns, error) of a history generator to the main
+    # thread, closing it early when the job is cancelled. Bars of stocks that
+    # are not loaded are stored by writer here, so the main thread does not
+    # have to load their histories to merge them.
+    def post_history(self, job, history, writer):
         try:
-            stock_data.retrieve_stock_web(dateFrom,dateTo,self.stock_list)
-        except Exception as e:
-            messagebox.showerror("Cannot Get Data from Web","Error: " + str(e))
-            return
-        self.display_stock_data()
-        messagebox.showinfo("Get Data From Web","Data Retrieved")
+            for symbol, columns, error in history:
+                stored = None
+                if error is None:
+                    stored = writer.store(symbol, *columns)
+                job.post(symbol, columns, error, stored)
+                if job.cancelled:
+                    break
+        finally:
+            history.close()
+
+    # Run a web history job, merging each symbol's bars as it arrives.
+    def start_history_job(self, title, symbols, work):
+        entered = datetime.now()
+        result = {"records": 0, "failed": []}
+
+        def merge(symbol, columns, error, stored):
+            self.step_job(symbol)
+            if error is not None:
+                result["failed"].append(symbol + " (" + str(error) + ")")
+                return
+            stock = self.stock_list.get(symbol)
+            if stock is None:
+                # deleted while the job was running
+                return
+            result["records"] += self.merge_bars(stock, columns, stored, entered, 'web')
+            if symbol == self.selected_symbol():
+                self.display_stock_data()
+
+        def done(_):
+            if result["failed"]:
+                messagebox.showerror("Cannot Get Data from Web","Could not retrieve " + ", ".join(result["failed"]))
+            messagebox.showinfo(title,str(result["records"]) + " new records retrieved")
+
+        self.start_job(title, len(symbols), work, on_message=merge, on_done=done)
+
+    # Merge bars from a job into stock and return the number of new records.
+    # stored is the count the job wrote to the database for a stock that was
+    # not loaded; such a stock is left to its loader, unless it was loaded
+    # while the job ran.
+    def merge_bars(self, stock, columns, stored, entered, source):
+        if stock.loaded or stored is None:
+            newRecords = stock.DataList.merge_columns(*columns, entered, source)
+            if stored is None:
+                return newRecords
+        return stored
 
     # Import CSV stock history file.
     def importCSV_web_data(self):
@@ -335,12 +660,67 @@ class StockApp:
             return
         filename = filedialog.askopenfilename(title="Select " + symbol + " File to Import",filetypes=[('Yahoo Finance! CSV','*.csv')])
         if filename != "":
-            try:
-                stock_data.import_stock_web_csv(self.stock_list,symbol,filename)
+            def work(job):
+                return stock_data.read_stock_csv(filename)
+
+            def done(columns):
+                stock = self.stock_list.get(symbol)
+                if stock is not None:
+                    stock.DataList.merge_columns(*columns, datetime.now(), 'csv')
                 self.display_stock_data()
                 messagebox.showinfo("Import Complete",symbol + " Import Complete")
-            except Exception as e:
-                messagebox.showerror("Import Error","Error importing CSV: " + str(e))   
+
+            self.start_job("Import CSV", 0, work, on_done=done, cancellable=False)
+
+    # Import a folder of per-symbol CSV files, the symbol is taken from each file name.
+    def importCSV_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder of CSV Files to Import")
+        if not folder:
+            return
+        files = stock_data.csv_files(folder)
+        entered = datetime.now()
+        result = {"files": 0, "records": 0, "failed": []}
+
+        def work(job):
+            parsed = stock_data.read_stock_csv_files(files)
+            try:
+                with stock_data.DailyDataWriter(self.stock_list) as writer:
+                    for filename, item, error in parsed:
+                        stored = None
+                        if error is None:
+                            stored = writer.store(*item)
+                        job.post(filename, item, error, stored)
+                        if job.cancelled:
+                            break
+            finally:
+                parsed.close()
+
+        def merge(filename, parsed, error, stored):
+            self.step_job(path.basename(filename))
+            if error is not None:
+                result["failed"].append((filename, str(error)))
+                return
+            symbol, days, closes, volumes = parsed
+            stock = self.stock_list.get(symbol)
+            if stock is None:
+                stock = Stock(symbol, symbol, 0)
+                self.stock_list.add(stock)
+                self.stockList.insert(END,symbol)
+            result["records"] += self.merge_bars(stock, (days, closes, volumes), stored, entered, 'csv')
+            result["files"] += 1
+            if symbol == self.selected_symbol():
+                self.display_stock_data()
+
+        def done(_):
+            # new symbols were added at the end
+            sortStocks(self.stock_list)
+            self.refresh_stock_list()
+            message = str(result['files']) + " files imported, " + str(result['records']) + " new records"
+            if result['failed']:
+                message += "\n" + str(len(result['failed'])) + " files failed"
+            messagebox.showinfo("Import Complete",message)
+
+        self.start_job("Import CSV Folder", len(files), work, on_message=merge, on_done=done)
     
     # Display stock price chart.
     def display_chart(self):
@@ -349,10 +729,81 @@ class StockApp:
         except Exception:
             messagebox.showwarning("Display Chart","No stock selected")
             return
+        stock = self.stock_list.get(symbol)
+        if stock is None:
+            return
+        self.show_chart(stock.symbol, lambda view: view.show(stock.symbol + " - " + stock.name, stock.DataList))
+
+    # Chart every stock's change since its first close on one set of axes.
+    def display_performance_chart(self):
+        def draw(view):
+            import stock_analytics
+            frame = stock_analytics.align_closes(self.stock_list)
+            view.show_frame("Performance", stock_analytics.normalised_performance(frame) * 100.0, "Change %")
+        self.show_chart(None, draw)
+
+    # Chart the total value of the portfolio over time.
+    def display_portfolio_chart(self):
+        def draw(view):
+            import stock_analytics
+            view.show_frame("Portfolio Value", stock_analytics.portfolio_value(self.stock_list), "Value")
+        self.show_chart(None, draw)
+
+    # Draw on the chart tab, creating the chart the first time, and select it
+    def show_chart(self, symbol, draw):
         try:
-            display_stock_chart(self.stock_list,symbol)
+            if self.chartView is None:
+                from stock_chart import ChartView
+                self.chartView = ChartView(self.chart_tab)
+            draw(self.chartView)
         except Exception as e:
             messagebox.showerror("Chart Error","Error displaying chart: " + str(e))
+            return
+        self.chartSymbol = symbol
+        self.notebook.select(self.chart_tab)
+
+    # Save a chart image of every stock into a folder, rendered in worker processes.
+    def export_charts(self):
+        import stock_chart
+        folder = filedialog.askdirectory(title="Select Folder to Export Charts to")
+        if not folder:
+            return
+        fmt = simpledialog.askstring("Export Charts","Image format (png or svg):",initialvalue="png")
+        if fmt is None:
+            return
+        fmt = fmt.strip().lower()
+        if fmt not in stock_chart.EXPORT_FORMATS:
+            messagebox.showerror("Export Charts","Unsupported format: " + fmt)
+            return
+        # loaded histories are copied here, the others are read from the
+        # database by the job, so nothing is loaded on this thread
+        snapshot = stock_data.stock_snapshot(self.stock_list)
+        result = {"charts": 0, "failed": []}
+
+        def work(job):
+            rendered = stock_chart.render_charts(stock_chart.snapshot_charts(snapshot), folder, fmt)
+            try:
+                for item in rendered:
+                    job.post(*item)
+                    if job.cancelled:
+                        break
+            finally:
+                rendered.close()
+
+        def saved(symbol, filename, error):
+            self.step_job(symbol)
+            if error is None:
+                result["charts"] += 1
+            else:
+                result["failed"].append(symbol)
+
+        def done(_):
+            message = str(result["charts"]) + " charts saved to " + folder
+            if result["failed"]:
+                message += "\nFailed: " + ", ".join(result["failed"])
+            messagebox.showinfo("Export Complete",message)
+
+        self.start_job("Export Charts", len(snapshot), work, on_message=saved, on_done=done)
 
     # Add a daily data point for the selected stock using simple dialogs
     def add_daily_data(self):
@@ -375,15 +826,12 @@ class StockApp:
         except Exception:
             messagebox.showerror("Invalid Input","Price and Volume must be numbers")
             return
-        # find stock and append data
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                stock.add_data(DailyData(date, price, volume))
-                # ensure data sorted
-                sortDailyData(self.stock_list)
-                self.display_stock_data()
-                messagebox.showinfo("Add Daily Data","Daily data added")
-                return
+        # find stock and add data, add_data keeps the data sorted by date
+        stock = self.stock_list.get(symbol)
+        if stock is not None:
+            stock.add_data(DailyData(date, price, volume))
+            self.display_stock_data()
+            messagebox.showinfo("Add Daily Data","Daily data added")
 
 
 def main():
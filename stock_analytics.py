@@ -0,0 +1,448 @@
+# Summary: This module contains the technical indicators for the stock analysis program.
+
+import math
+import numpy as np
+import pandas as pd
+
+# Trading days used to annualise volatility
+TRADING_DAYS = 252
+
+# From this many columns exponential averages step through the bars in
+# Python with each step vectorised over the columns; narrower inputs use
+# pandas' compiled ewm
+EWM_STEP_COLUMNS = 256
+
+# Every indicator takes a 1-D array of one stock's bars (oldest first) or a
+# 2-D array of bars x stocks, and returns arrays of the same shape with NaN
+# where the window is not full yet. NaN are only expected in front of the
+# first bar (the padding of shorter histories in a price_matrix). Rolling
+# windows are differences of cumulative sums and exponential averages step
+# through the bars once for all stocks together, so a whole portfolio costs
+# about as much as one stock.
+
+def _columns(values):
+    values = np.asarray(values, dtype=np.float64)
+    return values.reshape(len(values), -1)
+
+def _result(result, like):
+    return result[:, 0] if np.ndim(like) == 1 else result
+
+# Row of the first value in each column, len(x) for columns without any
+def _first_valid(x):
+    present = ~np.isnan(x)
+    return np.where(present.any(axis=0), present.argmax(axis=0), len(x))
+
+# Set the rows before start (one row number per column) to NaN
+def _mask_before(result, start):
+    result[np.arange(len(result))[:, None] < start] = np.nan
+    return result
+
+# Sum over the last window bars, NaN until window bars were seen
+def _rolling_sum(x, window):
+    total = np.cumsum(np.nan_to_num(x), axis=0)
+    result = np.full(x.shape, np.nan)
+    if window <= len(x):
+        result[window - 1] = total[window - 1]
+        np.subtract(total[window:], total[:-window], out=result[window:])
+    return _mask_before(result, _first_valid(x) + window - 1)
+
+def _rolling_mean(x, window):
+    return _rolling_sum(x, window) / window
+
+def _rolling_std(x, window, ddof=1):
+    # shift each column by its first value so the sums of squares stay small
+    first = _first_valid(x)
+    x = x - np.nan_to_num(x[np.minimum(first, len(x) - 1), np.arange(x.shape[1])])
+    total = _rolling_sum(x, window)
+    squares = _rolling_sum(x * x, window)
+    variance = (squares - total * total / window) / (window - ddof)
+    return np.sqrt(np.maximum(variance, 0.0))
+
+# Exponentially weighted mean y = alpha * x + (1 - alpha) * y[-1], starting
+# at each column's first value; NaN before min_periods values were seen.
+# alpha may hold one value per column, so several averages share one pass.
+def _ewm(x, alpha, min_periods=1):
+    first = _first_valid(x)
+    # fill the padding with the first value, the mean then starts exactly there
+    seed = np.nan_to_num(x[np.minimum(first, len(x) - 1), np.arange(x.shape[1])])
+    x = np.where(np.isnan(x), seed, x)
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), (x.shape[1],))
+    result = np.empty_like(x)
+    if x.shape[1] < EWM_STEP_COLUMNS:
+        # pandas runs the recursion in compiled code, one call per alpha
+        for value in np.unique(alpha):
+            columns = alpha == value
+            result[:, columns] = pd.DataFrame(x[:, columns]).ewm(alpha=value, adjust=False).mean().to_numpy()
+        return _mask_before(result, first + min_periods - 1)
+    # wide matrices: step through the bars once, each step covering all columns
+    decay = 1.0 - alpha
+    step = np.empty(x.shape[1])
+    if len(x):
+        result[0] = x[0]
+    for i in range(1, len(x)):
+        np.multiply(result[i - 1], decay, out=result[i])
+        np.multiply(x[i], alpha, out=step)
+        result[i] += step
+    return _mask_before(result, first + min_periods - 1)
+
+def _span_alpha(span):
+    return 2.0 / (span + 1.0)
+
+# Simple moving average
+def sma(values, window=20):
+    return _result(_rolling_mean(_columns(values), window), values)
+
+# Exponential moving average, seeded with the first bar
+def ema(values, span=20):
+    return _result(_ewm(_columns(values), _span_alpha(span)), values)
+
+# Simple returns over periods bars
+def returns(closes, periods=1):
+    x = _columns(closes)
+    result = np.full(x.shape, np.nan)
+    result[periods:] = x[periods:] / x[:-periods] - 1.0
+    return _result(result, closes)
+
+# Annualised standard deviation of daily returns over window bars
+def rolling_volatility(closes, window=20, periods_per_year=TRADING_DAYS):
+    daily = _columns(returns(closes))
+    return _result(_rolling_std(daily, window) * np.sqrt(periods_per_year), closes)
+
+# Volume weighted average price of the closes over window bars, or since the
+# first bar when window is None
+def vwap(closes, volumes, window=None):
+    prices = _columns(closes)
+    weights = _columns(volumes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if window is None:
+            traded = np.cumsum(np.nan_to_num(prices * weights), axis=0)
+            result = _mask_before(traded / np.cumsum(np.nan_to_num(weights), axis=0), _first_valid(prices))
+        else:
+            result = _rolling_sum(prices * weights, window) / _rolling_sum(weights, window)
+    return _result(result, closes)
+
+# Relative strength index with Wilder's smoothing
+def rsi(closes, period=14):
+    x = _columns(closes)
+    change = np.full(x.shape, np.nan)
+    change[1:] = x[1:] - x[:-1]
+    # gains and losses side by side, averaged in one pass
+    width = x.shape[1]
+    moves = _ewm(np.hstack((np.maximum(change, 0.0), np.maximum(-change, 0.0))), 1.0 / period)
+    gain = moves[:, :width]
+    loss = moves[:, width:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = 100.0 - 100.0 / (1.0 + gain / loss)
+    # the first change is on the bar after the first close
+    return _result(_mask_before(result, _first_valid(x) + period), closes)
+
+# MACD line, signal line and histogram
+def macd(closes, fast=12, slow=26, signal=9):
+    x = _columns(closes)
+    width = x.shape[1]
+    # fast and slow averages side by side, computed in one pass
+    alphas = np.repeat([_span_alpha(fast), _span_alpha(slow)], width)
+    averages = _ewm(np.hstack((x, x)), alphas)
+    line = averages[:, :width] - averages[:, width:]
+    signalLine = _ewm(line, _span_alpha(signal))
+    return _result(line, closes), _result(signalLine, closes), _result(line - signalLine, closes)
+
+# Bollinger bands: middle (SMA), upper and lower bands num_std deviations away
+def bollinger_bands(closes, window=20, num_std=2.0):
+    x = _columns(closes)
+    middle = _rolling_mean(x, window)
+    spread = _rolling_std(x, window, ddof=0) * num_std
+    return _result(middle, closes), _result(middle + spread, closes), _result(middle - spread, closes)
+
+def price_matrix(stocks):
+    """
+    Closes and volumes of many stocks as two bars x stocks arrays,
+    aligned on each stock's newest bar (the last row) and padded with
+    NaN in front of shorter histories. Returns (symbols, closes,
+    volumes).
+    """
+    stocks = list(stocks)
+    symbols = [stock.symbol for stock in stocks]
+    length = max([len(stock.DataList) for stock in stocks] + [0])
+    # one row per stock while filling, transposed to bars x stocks at the end
+    closes = np.full((len(stocks), length), np.nan)
+    volumes = np.full((len(stocks), length), np.nan)
+    for row, stock in enumerate(stocks):
+        series = stock.DataList
+        count = len(series)
+        if count:
+            closes[row, length - count:] = np.frombuffer(series.closes, dtype=np.float64)
+            volumes[row, length - count:] = np.frombuffer(series.volumes, dtype=np.float64)
+    return symbols, closes.T, volumes.T
+
+# The last frame built by align_closes and the (symbol, version) pairs it
+# was built from
+_alignedKey = None
+_alignedFrame = None
+
+def align_closes(stocks):
+    """
+    Closes of many stocks on one date index: a DataFrame with a row for
+    every day any of them has a bar and a column per symbol, NaN where a
+    stock has no bar that day. The days of all stocks are merged with
+    one np.unique and every close is scattered into place with one
+    indexed assignment. The frame is kept until a stock's series
+    changes, so callers must not modify it.
+    """
+    global _alignedKey, _alignedFrame
+    stocks = list(stocks)
+    key = tuple((stock.symbol, stock.DataList.version) for stock in stocks)
+    if key == _alignedKey:
+        return _alignedFrame
+    days = [np.frombuffer(stock.DataList.dates, dtype=np.int32) for stock in stocks]
+    closes = [np.frombuffer(stock.DataList.closes, dtype=np.float64) for stock in stocks]
+    allDays = np.concatenate(days) if stocks else np.empty(0, dtype=np.int32)
+    index, rows = np.unique(allDays, return_inverse=True)
+    matrix = np.full((len(index), len(stocks)), np.nan)
+    if len(allDays):
+        columns = np.repeat(np.arange(len(stocks)), [len(d) for d in days])
+        matrix[rows.ravel(), columns] = np.concatenate(closes)
+    frame = pd.DataFrame(matrix, index=pd.to_datetime(index, unit='D'),
+                         columns=[stock.symbol for stock in stocks])
+    _alignedKey, _alignedFrame = key, frame
+    return frame
+
+def normalised_performance(frame):
+    """
+    Change of each column of an aligned frame since its first close, as
+    a fraction (0.1 is 10% up). Days a stock has no bar carry its last
+    close forward; days before its first bar stay NaN.
+    """
+    filled = frame.ffill()
+    return filled / filled.bfill().iloc[0] - 1.0 if len(frame) else filled
+
+def portfolio_value(stocks):
+    """
+    Total value of the shares held in stocks on every day of their
+    aligned frame, valuing each stock at its last close up to that day
+    (nothing before its first bar). Returns a Series indexed by date.
+    """
+    stocks = list(stocks)
+    frame = align_closes(stocks)
+    shares = np.array([stock.shares for stock in stocks], dtype=np.float64)
+    values = np.nan_to_num(frame.ffill().to_numpy()) @ shares
+    return pd.Series(values, index=frame.index, name='Portfolio')
+
+def latest_indicators(stocks):
+    """
+    Latest value of every indicator for each stock, keyed by symbol.
+    All stocks are computed together on a price_matrix. Values are NaN
+    when a stock has too few bars for the window.
+    """
+    symbols, closes, volumes = price_matrix(stocks)
+    if not len(closes):
+        return {symbol: {} for symbol in symbols}
+    # windowed indicators only need the bars of their last window
+    tail = closes[-51:]
+    macdLine, macdSignal, _ = macd(closes)
+    middle, upper, lower = bollinger_bands(tail)
+    columns = {
+        "sma20": sma(tail, 20)[-1],
+        "sma50": sma(tail, 50)[-1],
+        "ema20": ema(closes, 20)[-1],
+        "return": returns(tail)[-1],
+        "volatility": rolling_volatility(tail)[-1],
+        "vwap20": vwap(tail, volumes[-51:], 20)[-1],
+        "rsi14": rsi(closes)[-1],
+        "macd": macdLine[-1],
+        "macd_signal": macdSignal[-1],
+        "bollinger_upper": upper[-1],
+        "bollinger_lower": lower[-1],
+    }
+    return {symbol: {name: float(values[i]) for name, values in columns.items()}
+            for i, symbol in enumerate(symbols)}
+
+# Indicators shown in reports: name, label and format of the value
+REPORT_INDICATORS = (
+    ("sma20", "SMA 20", "${:0.2f}"),
+    ("sma50", "SMA 50", "${:0.2f}"),
+    ("ema20", "EMA 20", "${:0.2f}"),
+    ("return", "Daily Return", "{:0.2%}"),
+    ("volatility", "Volatility (20 day, annualised)", "{:0.1%}"),
+    ("vwap20", "VWAP 20", "${:0.2f}"),
+    ("rsi14", "RSI 14", "{:0.1f}"),
+    ("macd", "MACD", "{:0.3f}"),
+    ("macd_signal", "MACD Signal", "{:0.3f}"),
+    ("bollinger_upper", "Bollinger Upper", "${:0.2f}"),
+    ("bollinger_lower", "Bollinger Lower", "${:0.2f}"),
+)
+
+# Report lines for one stock's latest_indicators, indicators without a value yet are left out
+def format_indicators(values):
+    lines = []
+    for name, label, fmt in REPORT_INDICATORS:
+        value = values.get(name, np.nan)
+        if not np.isnan(value):
+            lines.append(label + ": " + fmt.format(value))
+    return lines
+
+
+class RollingWindow:
+    """
+    The last window values pushed, with their sum, mean and variance
+    updated in O(1) per push: Welford's update, extended to take out
+    the value leaving the window.
+    """
+    __slots__ = ('window', 'count', 'total', 'mean', '_m2', '_values', '_next')
+
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._values = [0.0] * window
+        self._next = 0
+
+    def push(self, value):
+        if self.count < self.window:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+            self.total += value
+        else:
+            old = self._values[self._next]
+            mean = self.mean + (value - old) / self.window
+            self._m2 += (value - old) * (value - mean + old - self.mean)
+            self.mean = mean
+            self.total += value - old
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.window
+
+    @property
+    def full(self):
+        return self.count == self.window
+
+    def variance(self, ddof=1):
+        if self.count <= ddof:
+            return math.nan
+        return max(self._m2, 0.0) / (self.count - ddof)
+
+class StreamingIndicators:
+    """
+    Latest indicator values of one stock, the same as latest_indicators()
+    gives, kept up to date bar by bar. sync(series) feeds the bars
+    appended to a PriceSeries since the last sync at O(1) each; only
+    when older bars changed (its history_version moved) is the state
+    rebuilt from the whole series, with the vectorised indicators.
+    volume is the cumulative volume of all bars.
+    """
+    def __init__(self):
+        self._version = None
+        self._history = None
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.volume = 0.0
+        self._closes20 = RollingWindow(20)
+        self._closes50 = RollingWindow(50)
+        self._returns20 = RollingWindow(20)
+        self._traded20 = RollingWindow(20)
+        self._volumes20 = RollingWindow(20)
+        self._lastClose = None
+        self._lastReturn = math.nan
+        self._ema20 = self._ema12 = self._ema26 = self._signal = math.nan
+        self._gain = self._loss = math.nan
+
+    def sync(self, series):
+        if series.version == self._version:
+            return
+        if series.history_version != self._history or len(series) < self.count:
+            self._seed(series)
+        else:
+            closes = series.closes
+            volumes = series.volumes
+            for i in range(self.count, len(series)):
+                self.push(closes[i], volumes[i])
+        self._version = series.version
+        self._history = series.history_version
+
+    # Rebuild from all bars: averages from the vectorised indicators,
+    # rolling windows from the last bars
+    def _seed(self, series):
+        self._reset()
+        count = len(series)
+        if not count:
+            return
+        closes = np.array(series.closes, dtype=np.float64)
+        volumes = np.array(series.volumes, dtype=np.float64)
+        start = max(0, count - 51)
+        if start:
+            self._lastClose = float(closes[start - 1])
+        for i in range(start, count):
+            self._push_windows(float(closes[i]), float(volumes[i]))
+        self._ema20 = float(ema(closes, 20)[-1])
+        averages = _ewm(np.column_stack((closes, closes)), np.array([_span_alpha(12), _span_alpha(26)]))
+        self._ema12, self._ema26 = (float(v) for v in averages[-1])
+        self._signal = float(macd(closes)[1][-1])
+        if count > 1:
+            change = np.diff(closes)
+            moves = _ewm(np.column_stack((np.maximum(change, 0.0), np.maximum(-change, 0.0))), 1.0 / 14)
+            self._gain, self._loss = (float(v) for v in moves[-1])
+        self.count = count
+        self.volume = float(volumes.sum())
+
+    def _push_windows(self, close, volume):
+        if self._lastClose is not None:
+            self._lastReturn = close / self._lastClose - 1.0
+            self._returns20.push(self._lastReturn)
+        self._closes20.push(close)
+        self._closes50.push(close)
+        self._traded20.push(close * volume)
+        self._volumes20.push(volume)
+        self._lastClose = close
+
+    # Add the next bar
+    def push(self, close, volume):
+        last = self._lastClose
+        if last is None:
+            self._ema20 = self._ema12 = self._ema26 = close
+            self._signal = 0.0
+        else:
+            self._ema20 += _span_alpha(20) * (close - self._ema20)
+            self._ema12 += _span_alpha(12) * (close - self._ema12)
+            self._ema26 += _span_alpha(26) * (close - self._ema26)
+            self._signal += _span_alpha(9) * (self._ema12 - self._ema26 - self._signal)
+            change = close - last
+            if self.count == 1:
+                self._gain = max(change, 0.0)
+                self._loss = max(-change, 0.0)
+            else:
+                self._gain += (max(change, 0.0) - self._gain) / 14
+                self._loss += (max(-change, 0.0) - self._loss) / 14
+        self._push_windows(close, volume)
+        self.count += 1
+        self.volume += volume
+
+    def values(self):
+        closes20 = self._closes20
+        nan = math.nan
+        rsi = nan
+        if self.count > 14:
+            if self._loss:
+                rsi = 100.0 - 100.0 / (1.0 + self._gain / self._loss)
+            elif self._gain:
+                rsi = 100.0
+        band = 2.0 * math.sqrt(closes20.variance(0)) if closes20.full else nan
+        return {
+            "sma20": closes20.mean if closes20.full else nan,
+            "sma50": self._closes50.mean if self._closes50.full else nan,
+            "ema20": self._ema20,
+            "return": self._lastReturn,
+            "volatility": math.sqrt(self._returns20.variance()) * math.sqrt(TRADING_DAYS)
+                          if self._returns20.full else nan,
+            "vwap20": self._traded20.total / self._volumes20.total
+                      if self._volumes20.full and self._volumes20.total else nan,
+            "rsi14": rsi,
+            "macd": self._ema12 - self._ema26,
+            "macd_signal": self._signal,
+            "bollinger_upper": closes20.mean + band,
+            "bollinger_lower": closes20.mean - band,
+        }
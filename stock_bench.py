@@ -0,0 +1,200 @@
+# Summary: This module contains micro benchmarks for the stock analysis program.
+
+import os
+import sys
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from array import array
+from stock_class import Stock, DailyData, PriceSeries, entry_batch
+
+
+# DailyData as it was before __slots__ and batch entry stamps, used as the baseline
+class LegacyDailyData:
+    def __init__(self, date, close, volume):
+        self._date = date
+        self._close = close
+        self._volume = volume
+        try:
+            self._entered = datetime.now()
+        except Exception:
+            self._entered = date
+        self._source = None
+
+
+# Time building count records and measure the memory they hold
+def _measure_records(make, count):
+    dates = [datetime(2000, 1, 1) + timedelta(days=i) for i in range(count)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = make(dates)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "bytes_per_record": size / count, "count": len(records)}
+
+def bench_daily_data(count=200000):
+    """
+    Compare construction time and per-record memory of the legacy
+    DailyData against the slotted DailyData built inside entry_batch().
+    """
+    def make_legacy(dates):
+        return [LegacyDailyData(d, 1.0, 100.0) for d in dates]
+
+    def make_slotted(dates):
+        with entry_batch():
+            return [DailyData(d, 1.0, 100.0) for d in dates]
+
+    legacy = _measure_records(make_legacy, count)
+    slotted = _measure_records(make_slotted, count)
+    return {
+        "legacy": legacy,
+        "slotted": slotted,
+        "speedup": legacy["seconds"] / slotted["seconds"],
+        "memory_ratio": legacy["bytes_per_record"] / slotted["bytes_per_record"],
+    }
+
+def bench_price_series(count=200000):
+    """
+    Compare the memory of a list of DailyData against a PriceSeries
+    holding the same bars.
+    """
+    def make_list(dates):
+        with entry_batch():
+            return [DailyData(d, 1.0, 100.0) for d in dates]
+
+    def make_series(dates):
+        series = PriceSeries()
+        with entry_batch():
+            series.extend(DailyData(d, 1.0, 100.0) for d in dates)
+        return series
+
+    records = _measure_records(make_list, count)
+    series = _measure_records(make_series, count)
+    return {
+        "list": records,
+        "series": series,
+        "memory_ratio": records["bytes_per_record"] / series["bytes_per_record"],
+    }
+
+def bench_indicators(symbols=1000, bars=2520):
+    """
+    Time latest_indicators over a portfolio of symbols random walks of
+    bars days (10 years of trading days by default).
+    """
+    import numpy as np
+    import stock_analytics
+    rng = np.random.default_rng(0)
+    stocks = []
+    for i in range(symbols):
+        stock = Stock("S" + str(i), "Stock " + str(i), 0)
+        closes = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, bars)))
+        volumes = rng.integers(100000, 1000000, bars).astype(np.float64)
+        stock.DataList.merge_columns(array('i', range(bars)), array('d', closes), array('d', volumes))
+        stocks.append(stock)
+    start = time.perf_counter()
+    stock_analytics.latest_indicators(stocks)
+    return {"seconds": time.perf_counter() - start, "symbols": symbols, "bars": bars}
+
+def bench_streaming(symbols=5000, bars=260):
+    """
+    Time appending one bar to each of symbols stocks whose streaming
+    indicators are already seeded from bars days of history.
+    """
+    import numpy as np
+    rng = np.random.default_rng(0)
+    stocks = []
+    for i in range(symbols):
+        stock = Stock("S" + str(i), "Stock " + str(i), 0)
+        closes = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, bars)))
+        stock.DataList.merge_columns(array('i', range(bars)), array('d', closes), array('d', closes * 1000.0))
+        stock.indicators
+        stocks.append(stock)
+    with entry_batch():
+        newBars = [DailyData(datetime(2000, 1, 1) + timedelta(days=bars), 100.0, 100000.0) for _ in stocks]
+    start = time.perf_counter()
+    for stock, bar in zip(stocks, newBars):
+        stock.add_data(bar)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "symbols": symbols, "us_per_symbol": elapsed / symbols * 1e6}
+
+# Packages the startup modules must not import, they are imported where used
+HEAVY_MODULES = ("selenium", "bs4", "pandas", "numpy", "requests", "lxml", "tkinter", "matplotlib", "asyncio")
+
+# Most milliseconds importing each startup module may take. These are about
+# four times the times measured once the heavy imports were deferred, and
+# well below the 450ms stock_data took while it imported them.
+IMPORT_BUDGETS = {"stock_class": 25, "stock_data": 150, "stock_console": 150, "stocks": 150}
+
+# Cumulative microseconds of importing module and the top level packages it
+# pulled in, read from the stderr of python -X importtime
+def _parse_importtime(stderr, module):
+    nested = set()
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if name.startswith("  "):
+            nested.add(name.strip().split(".")[0])
+        elif name.strip() == module:
+            return int(parts[1]), nested
+        else:
+            # the next top level import starts here
+            nested = set()
+    raise RuntimeWarning("Import Not Found: " + module)
+
+def bench_import_time(modules=None, repeat=5):
+    """
+    Import each startup module repeat times in a fresh interpreter under
+    python -X importtime. Reports the best time, any HEAVY_MODULES it
+    imported and ok, which is False when it imported one of them or
+    went over its IMPORT_BUDGETS entry.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = {}
+    for module in modules or IMPORT_BUDGETS:
+        best = None
+        for _ in range(repeat):
+            run = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                                 cwd=here, capture_output=True, text=True)
+            if run.returncode:
+                raise RuntimeWarning("Import Failed: " + module + "\n" + run.stderr[-1000:])
+            micros, imported = _parse_importtime(run.stderr, module)
+            best = micros if best is None else min(best, micros)
+        heavy = [name for name in HEAVY_MODULES if name in imported]
+        budget = IMPORT_BUDGETS.get(module)
+        result[module] = {"ms": best / 1000.0, "budget_ms": budget, "heavy": heavy,
+                          "ok": not heavy and (budget is None or best / 1000.0 <= budget)}
+    return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    imports = bench_import_time()
+    print("Import time")
+    for module, result in imports.items():
+        status = "ok" if result['ok'] else "REGRESSION"
+        heavy = "  imports " + ", ".join(result['heavy']) if result['heavy'] else ""
+        print(f"   {module}: {result['ms']:0.1f}ms (budget {result['budget_ms']}ms) {status}{heavy}")
+    result = bench_daily_data(count)
+    print(f"DailyData x {count}")
+    print(f"   legacy:  {result['legacy']['seconds']:0.3f}s  {result['legacy']['bytes_per_record']:0.0f} bytes/record")
+    print(f"   slotted: {result['slotted']['seconds']:0.3f}s  {result['slotted']['bytes_per_record']:0.0f} bytes/record")
+    print(f"   {result['speedup']:0.1f}x faster, {result['memory_ratio']:0.1f}x less memory")
+    result = bench_price_series(count)
+    print(f"PriceSeries x {count}")
+    print(f"   list:   {result['list']['bytes_per_record']:0.0f} bytes/bar")
+    print(f"   series: {result['series']['bytes_per_record']:0.0f} bytes/bar")
+    print(f"   {result['memory_ratio']:0.1f}x less memory")
+    result = bench_indicators()
+    print(f"Indicators {result['symbols']} symbols x {result['bars']} bars")
+    print(f"   {result['seconds']:0.3f}s")
+    result = bench_streaming()
+    print(f"Streaming indicators, one new bar x {result['symbols']} symbols")
+    print(f"   {result['seconds']:0.3f}s  {result['us_per_symbol']:0.1f} us/symbol")
+    if not all(result['ok'] for result in imports.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# Summary: This module contains the price charts for the stock analysis program.
+
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# matplotlib is imported inside the functions that draw, so importing this
+# module for decimation stays cheap and works without matplotlib installed.
+
+def chart_dates(days):
+    """
+    Matplotlib date numbers for epoch days (PriceSeries.dates).
+    """
+    from matplotlib.dates import date2num
+    return np.asarray(days, dtype=np.float64) + date2num(datetime(1970, 1, 1))
+
+def decimate_minmax(x, y, bins):
+    """
+    Reduce a line of many points to about 2 * bins points that draw the
+    same at bins pixels wide: the points are split into at most bins
+    runs and only the lowest and highest point of each run are kept, in
+    order.
+    The first and last points are always kept. Shorter lines are
+    returned unchanged.
+    """
+    count = len(y)
+    bins = max(int(bins), 1)
+    if count <= 2 * bins:
+        return x, y
+    # runs of size points, the remainder after the last full run is
+    # shorter than a run
+    size = -(-count // bins)
+    bins = count // size
+    used = size * bins
+    runs = np.asarray(y[:used]).reshape(bins, size)
+    low = runs.argmin(axis=1)
+    high = runs.argmax(axis=1)
+    base = np.arange(bins) * size
+    keep = np.empty(2 * bins, dtype=np.intp)
+    keep[0::2] = np.minimum(low, high) + base
+    keep[1::2] = np.maximum(low, high) + base
+    rest = np.asarray(y[used:])
+    extra = [0, count - 1]
+    if len(rest):
+        extra += [used + rest.argmin(), used + rest.argmax()]
+    keep = np.unique(np.concatenate((keep, extra)))
+    return x[keep], y[keep]
+
+# Indexes of the points inside [low, high] plus one on each side, so the
+# line runs to the edges of the axes
+def visible_range(x, low, high):
+    start = max(int(np.searchsorted(x, low)) - 1, 0)
+    end = min(int(np.searchsorted(x, high, side='right')) + 1, len(x))
+    return start, end
+
+# Most lines labelled in a chart's legend; more would cover the lines
+LEGEND_LINES = 10
+
+def frame_lines(frame):
+    """
+    Matplotlib dates and (label, values) columns of a date indexed
+    DataFrame or Series, such as stock_analytics.align_closes returns.
+    """
+    days = frame.index.values.astype('datetime64[D]').astype(np.int64)
+    if frame.ndim == 1:
+        columns = [(frame.name, frame.to_numpy(dtype=np.float64))]
+    else:
+        columns = [(str(label), frame[label].to_numpy(dtype=np.float64)) for label in frame.columns]
+    return chart_dates(days), columns
+
+class ChartView:
+    """
+    Price chart embedded in a Tk container. The figure, canvas, toolbar
+    and lines are created once and reused for every chart shown. Only
+    the points that fit the axes' width in pixels are drawn, and
+    panning, zooming or resizing re-decimates the visible window of
+    every line.
+    """
+    def __init__(self, master):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        # (x, y) of every line without its missing values
+        self._data = []
+        self.figure = Figure(figsize=(6, 4), dpi=100)
+        self.axes = self.figure.add_subplot()
+        self.lines = []
+        self.axes.xaxis_date()
+        self.axes.grid(True)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, master, pack_toolbar=False)
+        self.toolbar.pack(side='bottom', fill='x')
+        self.canvas.get_tk_widget().pack(side='top', fill='both', expand=True)
+        self.axes.callbacks.connect('xlim_changed', self._redecimate)
+        self.canvas.mpl_connect('resize_event', self._redecimate)
+
+    # Show the closing prices of a PriceSeries
+    def show(self, title, series):
+        self.plot(title, chart_dates(series.dates), [(None, np.array(series.closes, dtype=np.float64))])
+
+    # Show every column of a date indexed DataFrame or Series as a line
+    def show_frame(self, title, frame, ylabel='Price'):
+        x, columns = frame_lines(frame)
+        self.plot(title, x, columns, ylabel)
+
+    def plot(self, title, x, columns, ylabel='Price'):
+        """
+        Draw one line per (label, values) column over the dates x,
+        skipping NaN values. Lines of the previous chart are reused and
+        only the labels of up to LEGEND_LINES lines get a legend.
+        """
+        self._data = []
+        for label, y in columns:
+            present = ~np.isnan(y)
+            self._data.append((x[present], y[present]))
+        while len(self.lines) < len(columns):
+            self.lines.append(self.axes.plot([], [], linewidth=1)[0])
+        while len(self.lines) > len(columns):
+            self.lines.pop().remove()
+        for line, (label, _) in zip(self.lines, columns):
+            line.set_label('_nolegend_' if label is None else label)
+        legend = self.axes.get_legend()
+        if legend is not None:
+            legend.remove()
+        if 1 < len(columns) <= LEGEND_LINES:
+            self.axes.legend(loc='upper left', fontsize='small')
+        self.axes.set_title(title)
+        self.axes.set_ylabel(ylabel)
+        shown = [(lx, ly) for lx, ly in self._data if len(lx)]
+        if shown:
+            low = min(lx[0] for lx, _ in shown)
+            high = max(lx[-1] for lx, _ in shown)
+            if high == low:
+                high = low + 1
+            bottom = min(ly.min() for _, ly in shown)
+            top = max(ly.max() for _, ly in shown)
+            margin = (top - bottom) * 0.05 or 1.0
+            self.axes.set_ylim(bottom - margin, top + margin)
+            # redraws the lines through _redecimate
+            self.axes.set_xlim(low, high)
+        else:
+            for line in self.lines:
+                line.set_data([], [])
+        # the toolbar's home view is the full chart
+        self.toolbar.update()
+        self.canvas.draw_idle()
+
+    def _redecimate(self, *args):
+        low, high = self.axes.get_xlim()
+        for line, (x, y) in zip(self.lines, self._data):
+            start, end = visible_range(x, low, high)
+            line.set_data(*decimate_minmax(x[start:end], y[start:end], self.axes.bbox.width))
+        self.canvas.draw_idle()
+
+
+# Image formats export_charts can write
+EXPORT_FORMATS = ('png', 'svg')
+
+# Figure, axes and line reused for every chart a process exports, created
+# by _init_chart_worker
+_template = None
+
+def _init_chart_worker(size, dpi):
+    """
+    Build the export figure template of this process. It draws with the
+    Agg canvas directly, so no display or pyplot backend is needed.
+    """
+    global _template
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    line, = axes.plot([], [], linewidth=1)
+    axes.xaxis_date()
+    axes.set_xlabel('Date')
+    axes.set_ylabel('Price')
+    axes.grid(True)
+    # fixed margins, laying out every chart again would double its cost
+    figure.subplots_adjust(left=0.1, right=0.97, bottom=0.12, top=0.92)
+    _template = (figure, axes, line)
+
+# Draw one stock's closes on the template and save it to filename
+def _render_chart_job(title, days, closes, filename, fmt):
+    figure, axes, line = _template
+    x = chart_dates(np.frombuffer(days, dtype=np.int32))
+    y = np.frombuffer(closes, dtype=np.float64)
+    line.set_data(*decimate_minmax(x, y, figure.get_figwidth() * figure.dpi))
+    low, high = x[0], x[-1] if len(x) > 1 else x[0] + 1
+    bottom, top = y.min(), y.max()
+    margin = (top - bottom) * 0.05 or 1.0
+    axes.set_xlim(low, high)
+    axes.set_ylim(bottom - margin, top + margin)
+    axes.set_title(title)
+    figure.savefig(filename, format=fmt)
+    return filename
+
+def render_charts(charts, directory, fmt='png', workers=None, size=(8, 4), dpi=100):
+    """
+    Save a price chart for each (symbol, title, days, closes) of charts
+    as directory/SYMBOL.fmt in a process pool of workers processes (all
+    cores by default, workers=1 renders in this process). Each process
+    sets up one figure and redraws it for every chart it is given.
+    charts is read as the charts are queued, so it may load them.
+    Yields (symbol, filename, error) as each chart finishes, error is
+    None on success. Closing the generator cancels charts not started.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise RuntimeWarning("Unsupported Chart Format")
+    os.makedirs(directory, exist_ok=True)
+    if workers == 1:
+        _init_chart_worker(size, dpi)
+        for symbol, title, days, closes in charts:
+            filename = os.path.join(directory, symbol + "." + fmt)
+            if not len(days):
+                yield symbol, filename, RuntimeWarning("No Data")
+                continue
+            try:
+                yield symbol, _render_chart_job(title, days, closes, filename, fmt), None
+            except Exception as e:
+                yield symbol, filename, e
+        return
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_worker, initargs=(size, dpi))
+    try:
+        futures = {}
+        for symbol, title, days, closes in charts:
+            filename = os.path.join(directory, symbol + "." + fmt)
+            if not len(days):
+                yield symbol, filename, RuntimeWarning("No Data")
+                continue
+            futures[pool.submit(_render_chart_job, title, days, closes, filename, fmt)] = (symbol, filename)
+        for future in as_completed(futures):
+            symbol, filename = futures[future]
+            try:
+                yield symbol, future.result(), None
+            except Exception as e:
+                yield symbol, filename, e
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def snapshot_charts(snapshot, stockDB="stocks.db"):
+    """
+    (symbol, title, days, closes) for render_charts from each entry of
+    a stock_data.stock_snapshot. Stocks whose daily data was not loaded
+    are read from stockDB one at a time, without loading them.
+    """
+    import stock_data
+    for symbol, name, shares, columns in snapshot:
+        if columns is None:
+            columns = stock_data.read_daily_columns(symbol, stockDB=stockDB)
+        yield symbol, symbol + " - " + name, columns[0], columns[1]
+
+def export_charts(stock_list, directory, symbols=None, fmt='png', workers=None, stockDB="stocks.db"):
+    """
+    Save price charts of the given symbols (the whole portfolio when
+    None) into directory with render_charts. Histories that are not
+    loaded are read from stockDB rather than loaded into the stocks.
+    Returns a dict with the number of charts saved and a list of
+    (symbol, error) for the symbols that are not tracked, have no data
+    or failed.
+    """
+    import stock_data
+    result = {"charts": 0, "failed": []}
+    if symbols is None:
+        stocks = list(stock_list)
+    else:
+        stocks = []
+        for symbol in symbols:
+            stock = stock_list.get(symbol.upper())
+            if stock is None:
+                result["failed"].append((symbol, "Symbol Not Found"))
+            else:
+                stocks.append(stock)
+    charts = snapshot_charts(stock_data.stock_snapshot(stocks), stockDB)
+    for symbol, filename, error in render_charts(charts, directory, fmt, workers):
+        if error is None:
+            result["charts"] += 1
+        else:
+            result["failed"].append((symbol, str(error)))
+    return result
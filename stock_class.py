@@ -1,6 +1,25 @@
 # Summary: This module contains the class definitions that will be used in the stock analysis program
 
-from datetime import datetime
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import count
+
+# Daily dates are stored as epoch days (days since 1/1/1970)
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+def date_to_epoch_day(date):
+    return date.toordinal() - EPOCH_ORDINAL
+
+def epoch_day_to_date(day):
+    return EPOCH + timedelta(days=day)
+
+# PriceSeries versions, unique across all series
+_seriesVersions = count(1)
 
 
 class Stock:
@@ -8,7 +27,9 @@ class Stock:
         self._symbol = symbol
         self._name = name
         self._shares = shares
-        self.DataList = [] # list of daily stock data
+        self._data = PriceSeries() # daily stock data
+        self._loader = None # deferred loader that fills the daily data on first access
+        self._indicators = None # streaming indicators, created on first use
 
     @property
     def symbol(self):
@@ -36,25 +57,156 @@ class Stock:
 
     def sell(self, shares):
        self._shares = self._shares - shares
+
+    # Daily stock data, filled by the deferred loader on first access
+    @property
+    def DataList(self):
+        if self._loader is not None:
+            loader = self._loader
+            self._loader = None
+            try:
+                loader(self)
+            except Exception:
+                self._loader = loader
+                raise
+        return self._data
+    @DataList.setter
+    def DataList(self, data):
+        self._loader = None
+        if isinstance(data, PriceSeries):
+            self._data = data
+        else:
+            self._data = PriceSeries(data)
+
+    # Defer loading daily data until DataList is first used
+    def set_loader(self, loader):
+        self._loader = loader
+
+    @property
+    def loaded(self):
+        return self._loader is None
        
-    # Add daily stock data
+    # Add daily stock data, keeping the data sorted with one entry per date
     def add_data(self, stock_data):
-        self.DataList.append(stock_data)
+        added = self.DataList.add(stock_data)
+        if self._indicators is not None:
+            self._indicators.sync(self._data)
+        return added
+
+    # Add many daily stock data records, returns the number of new dates
+    def add_many(self, stock_data):
+        added = self.DataList.add_many(stock_data)
+        if self._indicators is not None:
+            self._indicators.sync(self._data)
+        return added
+
+    # Latest indicator values kept up to date bar by bar, see
+    # stock_analytics.StreamingIndicators
+    @property
+    def indicators(self):
+        if self._indicators is None:
+            # import numpy based analytics only when indicators are used
+            from stock_analytics import StreamingIndicators
+            self._indicators = StreamingIndicators()
+        self._indicators.sync(self.DataList)
+        return self._indicators
+
+    # Running statistics of the daily data, see PriceSeries.summary()
+    def summary(self):
+        return self.DataList.summary()
     
 
+class Portfolio:
+    """
+    The stocks being tracked, indexed by symbol.
+    Lookup, add and delete by symbol are O(1), iteration follows the
+    order stocks were added in (or the order set by sort()). Supports
+    the list operations the program uses (append, clear, sort, len).
+    """
+    def __init__(self, stocks=()):
+        self._stocks = {} # symbol -> Stock
+        for stock in stocks:
+            self.add(stock)
+
+    def __len__(self):
+        return len(self._stocks)
+
+    def __iter__(self):
+        return iter(list(self._stocks.values()))
+
+    def __contains__(self, symbol):
+        if isinstance(symbol, Stock):
+            symbol = symbol.symbol
+        return symbol.upper() in self._stocks
+
+    def __getitem__(self, symbol):
+        return self._stocks[symbol.upper()]
+
+    def __delitem__(self, symbol):
+        del self._stocks[symbol.upper()]
+
+    # Find a stock by symbol, returns default when not tracked
+    def get(self, symbol, default=None):
+        return self._stocks.get(symbol.upper(), default)
+
+    def add(self, stock):
+        key = stock.symbol.upper()
+        if key in self._stocks:
+            raise RuntimeWarning("Stock Already Tracked: " + stock.symbol)
+        self._stocks[key] = stock
+
+    def append(self, stock):
+        self.add(stock)
+
+    # Remove a stock by symbol and return it, None when not tracked
+    def remove(self, symbol):
+        return self._stocks.pop(symbol.upper(), None)
+
+    def clear(self):
+        self._stocks.clear()
+
+    def symbols(self):
+        return [stock.symbol for stock in self._stocks.values()]
+
+    # Reorder the stocks, by symbol unless a key is given
+    def sort(self, key=None):
+        if key is None:
+            key = lambda s: s.symbol.upper()
+        stocks = sorted(self._stocks.values(), key=key)
+        self._stocks = {stock.symbol.upper(): stock for stock in stocks}
+
+
+# Entry timestamp shared by all records created inside entry_batch()
+_batch = threading.local()
+
+@contextmanager
+def entry_batch(entered=None):
+    """
+    Stamp every DailyData created in this block with one entry time
+    instead of calling datetime.now() per record.
+    """
+    previous = getattr(_batch, 'entered', None)
+    _batch.entered = entered if entered is not None else datetime.now()
+    try:
+        yield _batch.entered
+    finally:
+        _batch.entered = previous
+
+
 class DailyData:
-    def __init__(self, date, close, volume):
+    __slots__ = ('_date', '_close', '_volume', '_entered', '_source')
+
+    def __init__(self, date, close, volume, entered=None, source=None):
         self._date = date
         self._close = close
         self._volume = volume
         # timestamp when this record was entered into the system
-        try:
-            self._entered = datetime.now()
-        except Exception:
-            self._entered = date
+        if entered is None:
+            entered = getattr(_batch, 'entered', None) or datetime.now()
+        self._entered = entered
 
         # source of the data: 'web', 'csv', or None
-        self._source = None
+        self._source = source
 
     @property
     def date(self):
@@ -92,6 +244,346 @@ class DailyData:
         self._source = value
 
 
+# Sort a batch of columns by day, keeping the last bar for each day
+def _sorted_unique(days, closes, volumes, stamps):
+    order = sorted(range(len(days)), key=days.__getitem__)
+    outDays = array('i')
+    outCloses = array('d')
+    outVolumes = array('d')
+    outStamps = array('I')
+    for i in order:
+        if outDays and outDays[-1] == days[i]:
+            outCloses[-1] = closes[i]
+            outVolumes[-1] = volumes[i]
+            outStamps[-1] = stamps[i]
+        else:
+            outDays.append(days[i])
+            outCloses.append(closes[i])
+            outVolumes.append(volumes[i])
+            outStamps.append(stamps[i])
+    return outDays, outCloses, outVolumes, outStamps
+
+
+class PriceSeries:
+    """
+    Columnar store for the daily data of one stock.
+    Dates (epoch days), closing prices and volumes are kept in typed
+    arrays, about 24 bytes per bar instead of a DailyData object each.
+    Entry timestamp and source are stored once per distinct pair and
+    referenced by index. Indexing and iteration return DailyData
+    records, so the series can be used like the old list of DailyData.
+    Bars are kept sorted by date with at most one bar per date, a new
+    bar for an existing date replaces the stored one.
+    version changes whenever the bars change, so views can cache
+    anything derived from the series under it. history_version only
+    changes when bars already in the series change, appending newer
+    bars keeps it, so consumers can update incrementally.
+    """
+    def __init__(self, daily_data=()):
+        self._version = next(_seriesVersions)
+        self._history = self._version
+        self._dates = array('i')
+        self._closes = array('d')
+        self._volumes = array('d')
+        self._stamps = array('I') # index into _stampTable for each bar
+        self._stampTable = [] # distinct (entered, source) pairs
+        self._stampIndex = {} # (entered, source) -> index in _stampTable
+        # running totals, min and max close are recomputed on demand
+        # after the bar holding one of them is replaced or removed
+        self._closeSum = 0.0
+        self._volumeSum = 0.0
+        self._minClose = None
+        self._maxClose = None
+        self._extremesStale = False
+        self.extend(daily_data)
+
+    # Columns for vectorised consumers, do not modify directly
+    @property
+    def dates(self):
+        return self._dates
+
+    @property
+    def closes(self):
+        return self._closes
+
+    @property
+    def volumes(self):
+        return self._volumes
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def history_version(self):
+        return self._history
+
+    def _stamp(self, entered, source):
+        key = (entered, source)
+        index = self._stampIndex.get(key)
+        if index is None:
+            index = len(self._stampTable)
+            self._stampTable.append(key)
+            self._stampIndex[key] = index
+        return index
+
+    def _add_totals(self, close, volume):
+        self._closeSum += close
+        self._volumeSum += volume
+        if not self._extremesStale:
+            if self._minClose is None or close < self._minClose:
+                self._minClose = close
+            if self._maxClose is None or close > self._maxClose:
+                self._maxClose = close
+
+    def _remove_totals(self, close, volume):
+        self._closeSum -= close
+        self._volumeSum -= volume
+        if close == self._minClose or close == self._maxClose:
+            self._extremesStale = True
+
+    # Recompute all totals, after rebuilding the columns
+    def _reset_totals(self):
+        self._closeSum = math.fsum(self._closes)
+        self._volumeSum = math.fsum(self._volumes)
+        self._extremesStale = True
+
+    def summary(self):
+        """
+        Statistics of the series as a dict: count of bars, average, min
+        and max close, total volume and the first and last bars
+        (DailyData, None when empty). The totals are kept up to date as
+        bars are added or removed, so no bars are scanned.
+        """
+        count = len(self._dates)
+        if self._extremesStale:
+            self._minClose = min(self._closes) if count else None
+            self._maxClose = max(self._closes) if count else None
+            self._extremesStale = False
+        return {
+            "count": count,
+            "average": self._closeSum / count if count else None,
+            "min": self._minClose,
+            "max": self._maxClose,
+            "volume": self._volumeSum,
+            "first": self._record(0) if count else None,
+            "last": self._record(count - 1) if count else None,
+        }
+
+    def _record(self, i):
+        entered, source = self._stampTable[self._stamps[i]]
+        # bypass __init__ so views keep the stored entry time, even when it is None
+        daily_data = DailyData.__new__(DailyData)
+        daily_data._date = epoch_day_to_date(self._dates[i])
+        daily_data._close = self._closes[i]
+        daily_data._volume = self._volumes[i]
+        daily_data._entered = entered
+        daily_data._source = source
+        return daily_data
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(j) for j in range(*i.indices(len(self._dates)))]
+        if i < 0:
+            i += len(self._dates)
+        if i < 0 or i >= len(self._dates):
+            raise IndexError("PriceSeries index out of range")
+        return self._record(i)
+
+    def __iter__(self):
+        for i in range(len(self._dates)):
+            yield self._record(i)
+
+    # Append one bar given as column values without checking the order,
+    # for loaders that read bars already sorted (call sort() otherwise)
+    def append_values(self, day, close, volume, entered=None, source=None):
+        self._version = next(_seriesVersions)
+        self._dates.append(day)
+        self._closes.append(close)
+        self._volumes.append(volume)
+        self._stamps.append(self._stamp(entered, source))
+        self._add_totals(close, volume)
+
+    # Epoch day of the newest bar, None when empty
+    @property
+    def last_day(self):
+        return self._dates[-1] if self._dates else None
+
+    # Position of day in the series, or where it would be inserted
+    def position(self, day):
+        return bisect_left(self._dates, day)
+
+    def _insert(self, day, close, volume, stamp):
+        self._version = next(_seriesVersions)
+        self._add_totals(close, volume)
+        dates = self._dates
+        if not dates or day > dates[-1]:
+            dates.append(day)
+            self._closes.append(close)
+            self._volumes.append(volume)
+            self._stamps.append(stamp)
+            return True
+        self._history = self._version
+        i = bisect_left(dates, day)
+        if dates[i] == day:
+            self._remove_totals(self._closes[i], self._volumes[i])
+            self._closes[i] = close
+            self._volumes[i] = volume
+            self._stamps[i] = stamp
+            return False
+        dates.insert(i, day)
+        self._closes.insert(i, close)
+        self._volumes.insert(i, volume)
+        self._stamps.insert(i, stamp)
+        return True
+
+    # Remove the bar for day, returns False when there is none
+    def remove_day(self, day):
+        i = bisect_left(self._dates, day)
+        if i == len(self._dates) or self._dates[i] != day:
+            return False
+        self._version = next(_seriesVersions)
+        self._history = self._version
+        self._remove_totals(self._closes[i], self._volumes[i])
+        del self._dates[i]
+        del self._closes[i]
+        del self._volumes[i]
+        del self._stamps[i]
+        if not self._dates:
+            self._closeSum = 0.0
+            self._volumeSum = 0.0
+        return True
+
+    # Remove the bar with the date of daily_data, list compatible
+    def remove(self, daily_data):
+        if not self.remove_day(date_to_epoch_day(daily_data.date)):
+            raise ValueError("PriceSeries.remove(x): x not in series")
+
+    # Add one bar in date order, returns False when it replaced a bar with the same date
+    def add_values(self, day, close, volume, entered=None, source=None):
+        return self._insert(day, close, volume, self._stamp(entered, source))
+
+    def add(self, daily_data):
+        return self._insert(date_to_epoch_day(daily_data.date), daily_data.close, daily_data.volume,
+                            self._stamp(daily_data.entered, daily_data.source))
+
+    def merge(self, days, closes, volumes, stamps):
+        """
+        Merge a batch of bars given as columns (stamps are indexes from
+        _stamp) and return the number of new dates added.
+        An unsorted batch is sorted and de-duplicated first, the last bar
+        for a date wins. A batch after the last stored date is appended
+        to the columns directly, a small batch is inserted bar by bar,
+        and a large overlapping batch is merged in one pass.
+        """
+        if any(days[i] >= days[i + 1] for i in range(len(days) - 1)):
+            days, closes, volumes, stamps = _sorted_unique(days, closes, volumes, stamps)
+        if len(days) == 0:
+            return 0
+        self._version = next(_seriesVersions)
+        dates = self._dates
+        if not dates or days[0] > dates[-1]:
+            # array.extend copies directly when given arrays of the same type
+            dates.extend(days)
+            self._closes.extend(closes)
+            self._volumes.extend(volumes)
+            self._stamps.extend(stamps)
+            self._closeSum += math.fsum(closes)
+            self._volumeSum += math.fsum(volumes)
+            if not self._extremesStale:
+                low = min(closes)
+                high = max(closes)
+                if self._minClose is None or low < self._minClose:
+                    self._minClose = low
+                if self._maxClose is None or high > self._maxClose:
+                    self._maxClose = high
+            return len(days)
+        if len(days) * 8 < len(dates):
+            added = 0
+            for j in range(len(days)):
+                if self._insert(days[j], closes[j], volumes[j], stamps[j]):
+                    added += 1
+            return added
+        newDates = array('i')
+        newCloses = array('d')
+        newVolumes = array('d')
+        newStamps = array('I')
+        added = 0
+        i = 0
+        count = len(dates)
+        for j in range(len(days)):
+            day = days[j]
+            while i < count and dates[i] < day:
+                newDates.append(dates[i])
+                newCloses.append(self._closes[i])
+                newVolumes.append(self._volumes[i])
+                newStamps.append(self._stamps[i])
+                i += 1
+            if i < count and dates[i] == day:
+                i += 1
+            else:
+                added += 1
+            newDates.append(day)
+            newCloses.append(closes[j])
+            newVolumes.append(volumes[j])
+            newStamps.append(stamps[j])
+        newDates.extend(dates[i:])
+        newCloses.extend(self._closes[i:])
+        newVolumes.extend(self._volumes[i:])
+        newStamps.extend(self._stamps[i:])
+        self._dates = newDates
+        self._closes = newCloses
+        self._volumes = newVolumes
+        self._stamps = newStamps
+        self._history = self._version
+        self._reset_totals()
+        return added
+
+    # Merge columns that share one entry timestamp and source
+    def merge_columns(self, days, closes, volumes, entered=None, source=None):
+        stamps = array('I', [self._stamp(entered, source)]) * len(days)
+        return self.merge(days, closes, volumes, stamps)
+
+    def add_many(self, daily_data):
+        days = array('i')
+        closes = array('d')
+        volumes = array('d')
+        stamps = array('I')
+        for d in daily_data:
+            days.append(date_to_epoch_day(d.date))
+            closes.append(d.close)
+            volumes.append(d.volume)
+            stamps.append(self._stamp(d.entered, d.source))
+        return self.merge(days, closes, volumes, stamps)
+
+    # List compatible names
+    def append(self, daily_data):
+        self.add(daily_data)
+
+    def extend(self, daily_data):
+        self.add_many(daily_data)
+
+    def clear(self):
+        self.__init__()
+
+    # Sort bars from oldest to newest, key is accepted for list compatibility
+    # but the series is always ordered by date
+    def sort(self, key=None):
+        dates = self._dates
+        if all(dates[i] <= dates[i + 1] for i in range(len(dates) - 1)):
+            return
+        self._version = next(_seriesVersions)
+        self._history = self._version
+        order = sorted(range(len(dates)), key=dates.__getitem__)
+        self._dates = array('i', [dates[i] for i in order])
+        self._closes = array('d', [self._closes[i] for i in order])
+        self._volumes = array('d', [self._volumes[i] for i in order])
+        self._stamps = array('I', [self._stamps[i] for i in order])
+
+
 # Unit Test - Do Not Change Code Below This Line *** *** *** *** *** *** *** *** ***
 # main() is used for unit testing only. It will run when stock_class.py is run.
 # Run this to test your class code. Once you have eliminated all errors, you are
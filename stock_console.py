@@ -1,8 +1,8 @@
 # Summary: This module contains the user interface and logic for a console-based version of the stock manager program.
 
 from datetime import datetime
-from stock_class import Stock, DailyData
-from utilities import clear_screen, display_stock_chart
+from stock_class import Stock, DailyData, Portfolio
+from utilities import clear_screen, display_stock_chart, display_performance_chart, display_portfolio_chart
 from os import path
 import stock_data
 
@@ -92,6 +92,10 @@ def add_stock(stock_list):
         except:
             print("Invalid shares value. Cancelling.")
             return
+        if symbol.upper() in stock_list:
+            print(f"{symbol.upper()} is already tracked.")
+            input("Press Enter to continue...")
+            return
         new_stock = Stock(symbol.upper(), name, shares)
         stock_list.append(new_stock)
         print(f"Added {symbol}.")
@@ -128,20 +132,17 @@ def buy_stock(stock_list):
     symbol = input("Enter symbol to buy (or 0 to cancel): ").upper()
     if symbol == "0":
         return
-    found = False
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            try:
-                qty = float(input("Enter shares to buy: "))
-            except:
-                print("Invalid share amount")
-                input("Enter to continue...")
-                return
-            stock.buy(qty)
-            print(f"Bought {qty} shares of {symbol}.")
-            found = True
-            break
-    if not found:
+    stock = stock_list.get(symbol)
+    if stock is not None:
+        try:
+            qty = float(input("Enter shares to buy: "))
+        except:
+            print("Invalid share amount")
+            input("Enter to continue...")
+            return
+        stock.buy(qty)
+        print(f"Bought {qty} shares of {symbol}.")
+    else:
         print("Symbol not found")
     input("Press Enter to continue...")
 
@@ -154,20 +155,17 @@ def sell_stock(stock_list):
     symbol = input("Enter symbol to sell (or 0 to cancel): ").upper()
     if symbol == "0":
         return
-    found = False
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            try:
-                qty = float(input("Enter shares to sell: "))
-            except:
-                print("Invalid share amount")
-                input("Enter to continue...")
-                return
-            stock.sell(qty)
-            print(f"Sold {qty} shares of {symbol}.")
-            found = True
-            break
-    if not found:
+    stock = stock_list.get(symbol)
+    if stock is not None:
+        try:
+            qty = float(input("Enter shares to sell: "))
+        except:
+            print("Invalid share amount")
+            input("Enter to continue...")
+            return
+        stock.sell(qty)
+        print(f"Sold {qty} shares of {symbol}.")
+    else:
         print("Symbol not found")
     input("Press Enter to continue...")
 
@@ -178,12 +176,10 @@ def delete_stock(stock_list):
     symbol = input("Enter symbol to delete (or 0 to cancel): ").upper()
     if symbol == "0":
         return
-    for i,stock in enumerate(stock_list):
-        if stock.symbol == symbol:
-            del stock_list[i]
-            print(f"Deleted {symbol}.")
-            input("Press Enter to continue...")
-            return
+    if stock_list.remove(symbol) is not None:
+        print(f"Deleted {symbol}.")
+        input("Press Enter to continue...")
+        return
     print("Symbol not found")
     input("Press Enter to continue...")
 
@@ -205,11 +201,7 @@ def add_stock_data(stock_list):
     symbol = input("Enter symbol (or 0 to cancel): ").upper()
     if symbol == "0":
         return
-    target = None
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            target = stock
-            break
+    target = stock_list.get(symbol)
     if target is None:
         print("Symbol not found")
         input("Press Enter to continue...")
@@ -234,15 +226,33 @@ def add_stock_data(stock_list):
     input("Press Enter to continue...")
 
 # Display Report for All Stocks
-def display_report(stock_data):
+def display_report(stock_list):
     clear_screen()
     print("Stock Report ---")
-    for stock in stock_data:
-        print(f"{stock.symbol} - {stock.name} - {stock.shares} shares - {len(stock.DataList)} data points")
+    # running totals of each stock, daily data is not loaded or scanned
+    summaries = stock_data.portfolio_summary(stock_list)
+    # indicators of all loaded stocks are computed together, stocks whose
+    # daily data was not loaded are skipped rather than loaded for them
+    import stock_analytics
+    indicators = stock_analytics.latest_indicators([stock for stock in stock_list if stock.loaded])
+    total_value = 0.0
+    total_points = 0
+    for stock in stock_list:
+        summary = summaries[stock.symbol]
+        total_points += summary["count"]
+        print(f"{stock.symbol} - {stock.name} - {stock.shares} shares - {summary['count']} data points")
         # Optionally show most recent price
-        if stock.DataList:
-            last = stock.DataList[-1]
+        if summary["count"]:
+            last = summary["last"]
+            total_value += stock.shares * last.close
             print(f"   Last: {last.date.strftime('%m/%d/%y')} - ${last.close:0.2f} - Vol: {last.volume}")
+            print(f"   Avg: ${summary['average']:0.2f} - Min: ${summary['min']:0.2f} - Max: ${summary['max']:0.2f} - Total Vol: {summary['volume']:0.0f}")
+            lines = stock_analytics.format_indicators(indicators.get(stock.symbol, {}))
+            if lines:
+                print("   " + " - ".join(lines))
+    print(f"{len(stock_list)} stocks - {total_points} data points - Value at last close: ${total_value:0,.2f}")
+    if len(indicators) < len(stock_list):
+        print("Indicators are only shown for stocks whose daily data is loaded (e.g. after charting them).")
     input("Press Enter to continue...")
 
 
@@ -255,10 +265,15 @@ def display_chart(stock_list):
     for stock in stock_list:
         print(stock.symbol + ",",end="")
     print("]")
-    symbol = input("Enter symbol to chart (or 0 to cancel): ").upper()
+    symbol = input("Enter symbol to chart, ALL to compare every stock, VALUE for portfolio value (or 0 to cancel): ").upper()
     if symbol == "0":
         return
-    display_stock_chart(stock_list,symbol)
+    if symbol == "ALL":
+        display_performance_chart(stock_list)
+    elif symbol == "VALUE":
+        display_portfolio_chart(stock_list)
+    else:
+        display_stock_chart(stock_list,symbol)
     input("Press Enter to continue...")
 
 # Manage Data Menu
@@ -271,20 +286,29 @@ def manage_data(stock_list):
         print("2 - Load Data")
         print("3 - Retrieve From Web")
         print("4 - Import CSV")
+        print("5 - Import CSV Folder")
+        print("6 - Refresh From Web (new data only)")
+        print("7 - Export Charts")
         print("0 - Return")
         option = input("Enter Option: ")
         if option == "1":
-            stock_data.save_stock_data(stock_list)
-            print("Data saved.")
+            result = stock_data.save_stock_data(stock_list)
+            print(f"Data saved. {result['inserted']} inserted, {result['updated']} updated, {result['skipped']} skipped.")
             input("Press Enter to continue...")
         elif option == "2":
-            stock_data.load_stock_data(stock_list)
+            stock_data.load_stock_data(stock_list, lazy=True)
             print("Data loaded.")
             input("Press Enter to continue...")
         elif option == "3":
             retrieve_from_web(stock_list)
         elif option == "4":
             import_csv(stock_list)
+        elif option == "5":
+            import_csv_folder(stock_list)
+        elif option == "6":
+            refresh_from_web(stock_list)
+        elif option == "7":
+            export_charts(stock_list)
         elif option == "0":
             return
         else:
@@ -299,12 +323,25 @@ def retrieve_from_web(stock_list):
     dateFrom = input("Enter start date (m/d/yy): ")
     dateTo = input("Enter end date (m/d/yy): ")
     try:
-        count = stock_data.retrieve_stock_web(dateFrom, dateTo, stock_list)
+        with stock_data.PageCache() as cache:
+            count = stock_data.retrieve_stock_web(dateFrom, dateTo, stock_list, cache=cache)
         print(f"Retrieved {count} records.")
     except Exception as e:
         print("Error retrieving data:", e)
     input("Press Enter to continue...")
 
+# Get only the days newer than the stored history of each stock from Yahoo! Finance
+def refresh_from_web(stock_list):
+    clear_screen()
+    print("Refresh From Web ---")
+    try:
+        with stock_data.PageCache() as cache:
+            count = stock_data.refresh_stock_web(stock_list, cache=cache)
+        print(f"Retrieved {count} new records.")
+    except Exception as e:
+        print("Error retrieving data:", e)
+    input("Press Enter to continue...")
+
 # Import stock price and volume history from Yahoo! Finance using CSV Import
 def import_csv(stock_list):
     clear_screen()
@@ -316,18 +353,55 @@ def import_csv(stock_list):
     if not filename:
         return
     try:
-        stock_data.import_stock_web_csv(stock_list, symbol, filename)
-        print("Import complete.")
+        count = stock_data.import_stock_web_csv(stock_list, symbol, filename)
+        print(f"Import complete. {count} new records.")
+    except Exception as e:
+        print("Import failed:", e)
+    input("Press Enter to continue...")
+
+# Import a folder (or glob pattern) of per-symbol CSV files, symbol taken from each file name
+def import_csv_folder(stock_list):
+    clear_screen()
+    print("Import CSV Folder ---")
+    source = input("Enter folder or pattern, e.g. data/*.csv (or 0 to cancel): ")
+    if source == "0" or not source:
+        return
+    save = input("Also save to database (y/n): ").lower() == "y"
+    try:
+        result = stock_data.import_stock_csv_files(stock_list, source, stockDB="stocks.db" if save else None)
+        print(f"Imported {result['files']} files, {result['records']} new records.")
+        for filename, error in result['failed']:
+            print(f"   Failed: {filename} - {error}")
     except Exception as e:
         print("Import failed:", e)
     input("Press Enter to continue...")
 
+# Save chart images of some or all stocks into a folder without a display
+def export_charts(stock_list):
+    clear_screen()
+    print("Export Charts ---")
+    folder = input("Enter folder to save charts in (or 0 to cancel): ")
+    if folder == "0" or not folder:
+        return
+    fmt = input("Enter image format, png or svg (default png): ").lower() or "png"
+    symbols = input("Enter symbols separated by commas (blank for all): ").upper()
+    symbols = [s.strip() for s in symbols.split(",") if s.strip()] or None
+    try:
+        import stock_chart
+        result = stock_chart.export_charts(stock_list, folder, symbols, fmt)
+        print(f"Exported {result['charts']} charts.")
+        for symbol, error in result['failed']:
+            print(f"   Failed: {symbol} - {error}")
+    except Exception as e:
+        print("Export failed:", e)
+    input("Press Enter to continue...")
+
 # Begin program
 def main():
     #check for database, create if not exists
     if path.exists("stocks.db") == False:
         stock_data.create_database()
-    stock_list = []
+    stock_list = Portfolio()
     main_menu(stock_list)
 
 # Program Starts Here
@@ -1,182 +1,1285 @@
 import sqlite3
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
 import re
-import pandas as pd
 import os
 import csv
+import glob
 import time
-from datetime import datetime
+import threading
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from bisect import bisect_right
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from utilities import clear_screen
 from utilities import sortDailyData
-from stock_class import Stock, DailyData
+from stock_class import Stock, DailyData, date_to_epoch_day, epoch_day_to_date
 
-def create_database():
-    stockDB = "stocks.db"
-    conn = sqlite3.connect(stockDB)
-    cur = conn.cursor()
-    createStockTableCmd = """CREATE TABLE IF NOT EXISTS stocks (
-                            symbol TEXT NOT NULL PRIMARY KEY,
-                            name TEXT,
-                            shares REAL
-                        );"""
-    createDailyDataTableCmd = """CREATE TABLE IF NOT EXISTS dailyData (
+# selenium, requests, lxml, asyncio, numpy and pandas take most of a second
+# to import together, so they are imported inside the functions that use
+# them and loading or saving the database never pays for them.
+
+# Schema version stored in PRAGMA user_version.
+# 0 - original schema, dailyData.date stored as %m/%d/%y text
+# 1 - dailyData.date stored as ISO-8601 (YYYY-MM-DD) text in a
+#     WITHOUT ROWID table clustered on (symbol, date)
+SCHEMA_VERSION = 1
+
+# Convert a legacy %m/%d/%y date string to ISO-8601
+def _legacy_date_to_iso(value):
+    try:
+        return datetime.strptime(value,"%m/%d/%y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        # already converted or not a legacy date, keep as is
+        return value
+
+def _migrate_v1(cur):
+    createDailyDataTableCmd = """CREATE TABLE dailyData_v1 (
                                 symbol TEXT NOT NULL,
                                 date TEXT NOT NULL,
                                 price REAL NOT NULL,
                                 volume REAL NOT NULL,
                                 PRIMARY KEY (symbol, date)
-                        );"""   
-    cur.execute(createStockTableCmd)
+                        ) WITHOUT ROWID;"""
     cur.execute(createDailyDataTableCmd)
+    exists = cur.execute("""SELECT 1 FROM sqlite_master
+                            WHERE type='table' AND name='dailyData';""").fetchone()
+    if exists:
+        cur.execute("""INSERT OR REPLACE INTO dailyData_v1 (symbol, date, price, volume)
+                        SELECT symbol, legacy_date_to_iso(date), price, volume
+                        FROM dailyData;""")
+        cur.execute("DROP TABLE dailyData;")
+    cur.execute("ALTER TABLE dailyData_v1 RENAME TO dailyData;")
 
-def save_stock_data(stock_list):
-    stockDB = "stocks.db"
-    conn = sqlite3.connect(stockDB)
+# Migration steps, MIGRATIONS[n] upgrades a database from version n to n+1
+MIGRATIONS = [_migrate_v1]
+
+def migrate_database(conn):
+    """
+    Bring an open database up to SCHEMA_VERSION.
+    Each step runs in its own transaction together with the
+    user_version update, so an interrupted migration can be rerun.
+    """
+    conn.create_function("legacy_date_to_iso", 1, _legacy_date_to_iso)
     cur = conn.cursor()
-    insertStockCmd = """INSERT INTO stocks
+    cur.execute("""CREATE TABLE IF NOT EXISTS stocks (
+                            symbol TEXT NOT NULL PRIMARY KEY,
+                            name TEXT,
+                            shares REAL
+                        );""")
+    version = cur.execute("PRAGMA user_version;").fetchone()[0]
+    while version < SCHEMA_VERSION:
+        try:
+            cur.execute("BEGIN;")
+            MIGRATIONS[version](cur)
+            version = version + 1
+            cur.execute(f"PRAGMA user_version = {version};")
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+    return version
+
+# Open the database, upgrading its schema if needed
+def connect_database(stockDB="stocks.db"):
+    conn = sqlite3.connect(stockDB)
+    migrate_database(conn)
+    return conn
+
+def create_database(stockDB="stocks.db"):
+    conn = connect_database(stockDB)
+    conn.close()
+
+UPSERT_STOCK_CMD = """INSERT INTO stocks
                             (symbol, name, shares)
                             VALUES
-                            (?, ?, ?); """
-    insertDailyDataCmd = """INSERT INTO dailyData
+                            (?, ?, ?)
+                            ON CONFLICT(symbol) DO UPDATE SET
+                            name=excluded.name, shares=excluded.shares; """
+UPSERT_DAILY_DATA_CMD = """INSERT INTO dailyData
                                     (symbol, date, price, volume)
                                     VALUES
-                                    (?, ?, ?, ?);"""
+                                    (?, ?, ?, ?)
+                                    ON CONFLICT(symbol, date) DO UPDATE SET
+                                    price=excluded.price, volume=excluded.volume
+                                    WHERE price IS NOT excluded.price
+                                    OR volume IS NOT excluded.volume;"""
+
+def _upsert_daily_data(cur, symbol, days, closes, volumes, isoCache, batch_size=5000):
+    """
+    Upsert one stock's daily columns with executemany in batches of
+    batch_size rows. isoCache maps epoch days to ISO date strings and
+    is shared between calls. Returns (rows written, rows changed).
+    """
+    totalRows = 0
+    changedRows = 0
+    batch = []
+    for day, close, volume in zip(days, closes, volumes):
+        isoDate = isoCache.get(day)
+        if isoDate is None:
+            isoDate = epoch_day_to_date(day).strftime("%Y-%m-%d")
+            isoCache[day] = isoDate
+        batch.append((symbol, isoDate, close, volume))
+        if len(batch) >= batch_size:
+            cur.executemany(UPSERT_DAILY_DATA_CMD, batch)
+            changedRows += cur.rowcount
+            totalRows += len(batch)
+            batch = []
+    if batch:
+        cur.executemany(UPSERT_DAILY_DATA_CMD, batch)
+        changedRows += cur.rowcount
+        totalRows += len(batch)
+    return totalRows, changedRows
+
+COUNT_DAILY_DATA_CMD = "SELECT count(*) FROM dailyData WHERE symbol = ?;"
+
+def _upsert_new_days(cur, symbol, days, closes, volumes, isoCache):
+    """
+    _upsert_daily_data for one stock that returns the number of new
+    dates stored, the same count merge_columns gives for a stock in
+    memory.
+    """
+    before = cur.execute(COUNT_DAILY_DATA_CMD, (symbol,)).fetchone()[0]
+    _upsert_daily_data(cur, symbol, days, closes, volumes, isoCache)
+    return cur.execute(COUNT_DAILY_DATA_CMD, (symbol,)).fetchone()[0] - before
+
+def stock_snapshot(stock_list):
+    """
+    (symbol, name, shares, columns) of every stock, columns being copies
+    of the (dates, closes, volumes) arrays, or None when the daily data
+    was never loaded. Copying is one memcpy per column, so a snapshot
+    taken on the GUI thread can be saved in the background while the
+    stocks are edited.
+    """
+    snapshot = []
     for stock in stock_list:
-        insertValues = (stock.symbol, stock.name, stock.shares)
+        columns = None
+        if stock.loaded:
+            series = stock.DataList
+            columns = (series.dates[:], series.closes[:], series.volumes[:])
+        snapshot.append((stock.symbol, stock.name, stock.shares, columns))
+    return snapshot
+
+def save_stock_data(stock_list, stockDB="stocks.db", batch_size=5000):
+    """
+    Save stocks and their daily data in a single transaction, see
+    save_stock_snapshot.
+    """
+    return save_stock_snapshot(stock_snapshot(stock_list), stockDB, batch_size)
+
+def save_stock_snapshot(snapshot, stockDB="stocks.db", batch_size=5000):
+    """
+    Save a stock_snapshot in a single transaction.
+    Rows are written in batches with executemany using upsert semantics,
+    so existing rows are updated instead of raising duplicate key errors.
+    Returns a dict with the number of daily rows inserted, updated and
+    skipped (already stored with identical values).
+    """
+    conn = connect_database(stockDB)
+    cur = conn.cursor()
+    countCmd = "SELECT count(*) FROM dailyData;"
+    totalRows = 0
+    changedRows = 0
+    try:
+        cur.execute("BEGIN;")
+        rowsBefore = cur.execute(countCmd).fetchone()[0]
+        cur.executemany(UPSERT_STOCK_CMD,
+                        [(symbol, name, shares) for symbol, name, shares, _ in snapshot])
+        isoCache = {}
+        for symbol, name, shares, columns in snapshot:
+            if columns is None:
+                # daily data was never loaded, so it is unchanged
+                continue
+            rows, changed = _upsert_daily_data(cur, symbol, *columns, isoCache, batch_size)
+            totalRows += rows
+            changedRows += changed
+        rowsAfter = cur.execute(countCmd).fetchone()[0]
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    inserted = rowsAfter - rowsBefore
+    return {"inserted": inserted,
+            "updated": changedRows - inserted,
+            "skipped": totalRows - changedRows}
+
+class DailyDataWriter:
+    """
+    Stores bars of stocks whose daily data is not loaded straight into
+    stockDB, so a background job can save them without running the
+    stocks' loaders; the loader reads them when a stock is first used.
+    Each stock is committed on its own. The connection is opened on
+    first use, on the thread that stores.
+    """
+    def __init__(self, stock_list, stockDB="stocks.db"):
+        self._stock_list = stock_list
+        self._stockDB = stockDB
+        self._conn = None
+        self._isoCache = {}
+
+    def store(self, symbol, days, closes, volumes):
+        """
+        Upsert the columns of symbol when it is tracked and its daily
+        data is not loaded. Returns the number of new dates stored, or
+        None when nothing was stored and the columns are to be merged
+        into the stock instead.
+        """
+        stock = self._stock_list.get(symbol)
+        if stock is None or stock.loaded:
+            return None
+        if self._conn is None:
+            self._conn = connect_database(self._stockDB)
+        cur = self._conn.cursor()
         try:
-            cur.execute(insertStockCmd, insertValues)
-            cur.execute("COMMIT;")
+            newDays = _upsert_new_days(cur, symbol, days, closes, volumes, self._isoCache)
+            self._conn.commit()
         except:
-            pass
-        for daily_data in stock.DataList: 
-            insertValues = (stock.symbol,daily_data.date.strftime("%m/%d/%y"),daily_data.close,daily_data.volume)
+            self._conn.rollback()
+            raise
+        return newDays
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Convert a datetime, date or date string to the ISO-8601 text stored in dailyData
+def _to_iso_date(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        for fmt in ("%Y-%m-%d", "%m/%d/%y", "%m/%d/%Y"):
             try:
-                cur.execute(insertDailyDataCmd, insertValues)
-                cur.execute("COMMIT;")
-            except:
-                pass
-    
-def load_stock_data(stock_list):
+                return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        raise ValueError("Invalid date: " + value)
+    return value.strftime("%Y-%m-%d")
+
+# Build the WHERE conditions for an optional date window on dailyData
+def _date_window(start, end, alias="d"):
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(alias + ".date >= ?")
+        params.append(_to_iso_date(start))
+    if end is not None:
+        conditions.append(alias + ".date <= ?")
+        params.append(_to_iso_date(end))
+    return conditions, params
+
+def load_daily_data(stock, start=None, end=None, stockDB="stocks.db"):
+    """
+    Load the daily data of a single stock, optionally limited to the
+    window start..end (inclusive). Uses a primary key seek on
+    (symbol, date), so the cost depends only on the rows returned.
+    """
+    conditions, params = _date_window(start, end)
+    selectCmd = """SELECT d.date, d.price, d.volume
+                    FROM dailyData d
+                    WHERE """ + " AND ".join(["d.symbol = ?"] + conditions) + """
+                    ORDER BY d.date; """
+    conn = connect_database(stockDB)
+    try:
+        dayCache = {}
+        loadedAt = datetime.now()
+        series = stock.DataList
+        for row in conn.execute(selectCmd, [stock.symbol] + params):
+            day = dayCache.get(row[0])
+            if day is None:
+                day = date_to_epoch_day(datetime.fromisoformat(row[0]))
+                dayCache[row[0]] = day
+            series.append_values(day,float(row[1]),float(row[2]),loadedAt)
+    finally:
+        conn.close()
+
+def read_daily_columns(symbol, start=None, end=None, stockDB="stocks.db"):
+    """
+    The (days, closes, volumes) columns of one symbol's stored daily
+    data, read with the same seek as load_daily_data but without a
+    Stock, so a background job can read histories without loading
+    the stocks.
+    """
+    conditions, params = _date_window(start, end)
+    selectCmd = """SELECT d.date, d.price, d.volume
+                    FROM dailyData d
+                    WHERE """ + " AND ".join(["d.symbol = ?"] + conditions) + """
+                    ORDER BY d.date; """
+    days = array('i')
+    closes = array('d')
+    volumes = array('d')
+    conn = connect_database(stockDB)
+    try:
+        for row in conn.execute(selectCmd, [symbol] + params):
+            days.append(date_to_epoch_day(datetime.fromisoformat(row[0])))
+            closes.append(float(row[1]))
+            volumes.append(float(row[2]))
+    finally:
+        conn.close()
+    return days, closes, volumes
+
+def load_stock_data(stock_list, symbols=None, start=None, end=None, lazy=False, stockDB="stocks.db"):
+    """
+    Load stocks and their daily data.
+    symbols limits the load to the given symbols, start and end limit
+    the daily data to a date window. With lazy=True only the stocks
+    table is read and each stock's DataList is filled from the database
+    the first time it is used.
+    Otherwise all rows are streamed from one join of stocks and dailyData
+    ordered by symbol and date, and grouped by symbol as they arrive.
+    Dates repeat across symbols, so each date string is parsed only once.
+    Only stocks whose rows did not come back in date order are sorted.
+    """
     stock_list.clear()
-    stockDB = "stocks.db"
-    conn = sqlite3.connect(stockDB)
-    stockCur = conn.cursor()
-    stockSelectCmd = """SELECT symbol, name, shares
-                    FROM stocks; """
-    stockCur.execute(stockSelectCmd)
-    stockRows = stockCur.fetchall()
-    for row in stockRows:
-        new_stock = Stock(row[0],row[1],row[2])
-        dailyDataCur = conn.cursor()
-        dailyDataCmd = """SELECT date, price, volume
-                        FROM dailyData
-                        WHERE symbol=?; """
-        selectValue = (new_stock.symbol)
-        dailyDataCur.execute(dailyDataCmd,(selectValue,))
-        dailyDataRows = dailyDataCur.fetchall()
-        for dailyRow in dailyDataRows:
-            daily_data = DailyData(datetime.strptime(dailyRow[0],"%m/%d/%y"),float(dailyRow[1]),float(dailyRow[2]))
-            new_stock.add_data(daily_data)
-        stock_list.append(new_stock)
-    sortDailyData(stock_list)
-
-def retrieve_stock_web(dateStart,dateEnd,stock_list):
-    dateFrom = str(int(time.mktime(time.strptime(dateStart,"%m/%d/%y"))))
-    dateTo   = str(int(time.mktime(time.strptime(dateEnd,"%m/%d/%y"))))
-    recordCount = 0
+    symbolConditions = []
+    symbolParams = []
+    if symbols is not None:
+        symbolParams = [symbol.upper() for symbol in symbols]
+        symbolConditions.append("s.symbol IN (" + ",".join("?" * len(symbolParams)) + ")")
+    conn = connect_database(stockDB)
+    cur = conn.cursor()
+    cur.arraysize = 10000
+    if lazy:
+        stockSelectCmd = "SELECT s.symbol, s.name, s.shares FROM stocks s"
+        if symbolConditions:
+            stockSelectCmd += " WHERE " + " AND ".join(symbolConditions)
+        try:
+            for row in cur.execute(stockSelectCmd + " ORDER BY s.symbol;", symbolParams):
+                new_stock = Stock(row[0],row[1],row[2])
+                new_stock.set_loader(partial(load_daily_data, start=start, end=end, stockDB=stockDB))
+                stock_list.append(new_stock)
+        finally:
+            conn.close()
+        return
+    dateConditions, dateParams = _date_window(start, end)
+    selectCmd = """SELECT s.symbol, s.name, s.shares, d.date, d.price, d.volume
+                    FROM stocks s
+                    LEFT JOIN dailyData d ON """ + " AND ".join(["d.symbol = s.symbol"] + dateConditions)
+    if symbolConditions:
+        selectCmd += " WHERE " + " AND ".join(symbolConditions)
+    selectCmd += " ORDER BY s.symbol, d.date; "
+    dayCache = {}
+    loadedAt = datetime.now()
+    unsorted = []
+    new_stock = None
+    series = None
+    lastDay = None
+    inOrder = True
+    try:
+        cur.execute(selectCmd, dateParams + symbolParams)
+        for row in cur:
+            if new_stock is None or row[0] != new_stock.symbol:
+                if new_stock is not None and not inOrder:
+                    unsorted.append(new_stock)
+                new_stock = Stock(row[0],row[1],row[2])
+                series = new_stock.DataList
+                stock_list.append(new_stock)
+                lastDay = None
+                inOrder = True
+            if row[3] is None:
+                # stock without any daily data
+                continue
+            day = dayCache.get(row[3])
+            if day is None:
+                day = date_to_epoch_day(datetime.fromisoformat(row[3]))
+                dayCache[row[3]] = day
+            if lastDay is not None and day < lastDay:
+                inOrder = False
+            lastDay = day
+            series.append_values(day,float(row[4]),float(row[5]),loadedAt)
+        if new_stock is not None and not inOrder:
+            unsorted.append(new_stock)
+    finally:
+        conn.close()
+    sortDailyData(unsorted)
 
+def last_stored_days(symbols, stockDB="stocks.db"):
+    """
+    Epoch day of the newest stored bar for each symbol, found with one
+    primary key seek per symbol. Symbols without data are left out.
+    """
+    conn = connect_database(stockDB)
+    result = {}
+    try:
+        for symbol in symbols:
+            row = conn.execute("SELECT max(date) FROM dailyData WHERE symbol = ?;", (symbol,)).fetchone()
+            if row[0] is not None:
+                result[symbol] = date_to_epoch_day(datetime.fromisoformat(row[0]))
+    finally:
+        conn.close()
+    return result
+
+# Newest bar of a stock, from memory when loaded, otherwise from the database
+def _last_day(stock, stored):
+    last = stored.get(stock.symbol)
+    if stock.loaded and stock.DataList.last_day is not None:
+        if last is None or stock.DataList.last_day > last:
+            last = stock.DataList.last_day
+    return last
+
+def stored_summaries(symbols, stockDB="stocks.db"):
+    """
+    Summaries in the form of PriceSeries.summary() computed by the
+    database from the stored daily data, without loading it. The first
+    and last bars are found with primary key seeks.
+    """
+    conn = connect_database(stockDB)
+    result = {}
+    try:
+        for symbol in symbols:
+            count, priceSum, low, high, volume = conn.execute(
+                "SELECT count(*), sum(price), min(price), max(price), total(volume) FROM dailyData WHERE symbol = ?;",
+                (symbol,)).fetchone()
+            bars = []
+            for order in ("ASC", "DESC"):
+                row = conn.execute("SELECT date, price, volume FROM dailyData WHERE symbol = ? ORDER BY date "
+                                   + order + " LIMIT 1;", (symbol,)).fetchone()
+                bars.append(DailyData(datetime.fromisoformat(row[0]), float(row[1]), float(row[2]))
+                            if row else None)
+            result[symbol] = {
+                "count": count,
+                "average": priceSum / count if count else None,
+                "min": low,
+                "max": high,
+                "volume": volume,
+                "first": bars[0],
+                "last": bars[1],
+            }
+    finally:
+        conn.close()
+    return result
+
+def portfolio_summary(stock_list, stockDB="stocks.db"):
+    """
+    PriceSeries.summary() of every stock, keyed by symbol. Loaded stocks
+    report their running totals; stocks whose daily data has not been
+    loaded yet are summarised by stored_summaries() instead of loading
+    them (stockDB=None loads them).
+    """
+    result = {}
+    unloaded = []
     for stock in stock_list:
-        stockSymbol = stock.symbol
-
-        url = (
-            "https://finance.yahoo.com/quote/" + stockSymbol +
-            "/history?period1=" + dateFrom +
-            "&period2=" + dateTo +
-            "&interval=1d&filter=history&frequency=1d"
-        )
-
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option('excludeSwitches',['enable-logging'])
-        options.add_experimental_option(
-            "prefs",
-            {'profile.managed_default_content_settings.javascript': 2}
-        )
+        if stock.loaded or not stockDB:
+            result[stock.symbol] = stock.summary()
+        else:
+            unloaded.append(stock.symbol)
+    if unloaded:
+        result.update(stored_summaries(unloaded, stockDB))
+    return result
+
+# Yahoo! Finance history page, period1 and period2 are Unix timestamps
+YAHOO_HISTORY_URL = ("https://finance.yahoo.com/quote/{symbol}/history?period1={period1}"
+                     "&period2={period2}&interval=1d&filter=history&frequency=1d")
+
+def _new_chrome_driver(page_timeout):
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option('excludeSwitches',['enable-logging'])
+    options.add_experimental_option(
+        "prefs",
+        {'profile.managed_default_content_settings.javascript': 2}
+    )
+    try:
+        driver = webdriver.Chrome(options=options)
+    except Exception:
+        raise RuntimeWarning("Chrome Driver Not Found")
+    driver.set_page_load_timeout(page_timeout)
+    return driver
+
+class DriverPool:
+    """
+    Pool of up to size long-lived browser drivers shared by scraping
+    threads. Drivers are started on demand, handed out one per thread
+    and reused for the next symbol; a driver that failed is quit and
+    replaced by a fresh one on the next acquire().
+    """
+    def __init__(self, size=4, page_timeout=30, driver_factory=_new_chrome_driver):
+        self._size = size
+        self._page_timeout = page_timeout
+        self._driver_factory = driver_factory
+        # guards both lists, notified whenever a driver or a slot is freed
+        self._available = threading.Condition()
+        self._idle = []
+        self._drivers = [] # every live driver, idle or in use
+
+    def acquire(self):
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._drivers) < self._size:
+                    self._drivers.append(None) # reserve a slot
+                    break
+                self._available.wait()
+        try:
+            driver = self._driver_factory(self._page_timeout)
+        except:
+            with self._available:
+                self._drivers.remove(None)
+                self._available.notify()
+            raise
+        with self._available:
+            self._drivers[self._drivers.index(None)] = driver
+        return driver
+
+    def release(self, driver, failed=False):
+        with self._available:
+            if failed:
+                # frees the slot, a waiting thread starts a new driver in it
+                self._drivers.remove(driver)
+            else:
+                self._idle.append(driver)
+            self._available.notify()
+        if failed:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._available:
+            drivers = [d for d in self._drivers if d is not None]
+            self._drivers = []
+            self._idle = []
+            self._available.notify_all()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HistoryFetcher:
+    """
+    Interface for the backends that download history pages.
+    fetch(url) returns the page html and raises on failure, close()
+    releases connections, browsers or other resources. fetch() may be
+    called from several threads at once.
+    """
+    def fetch(self, url):
+        raise NotImplementedError
 
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HttpFetcher(HistoryFetcher):
+    """
+    Plain HTTP backend using one requests session, so connections are
+    kept alive and pooled (pool_size per host) across symbols.
+    """
+    USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/120.0 Safari/537.36")
+
+    def __init__(self, pool_size=8, timeout=10):
+        import requests
+        self._timeout = timeout
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers["User-Agent"] = self.USER_AGENT
+
+    def fetch(self, url):
+        response = self._session.get(url, timeout=self._timeout)
+        response.raise_for_status()
+        return response.text
+
+    def close(self):
+        self._session.close()
+
+class SeleniumFetcher(HistoryFetcher):
+    """
+    Browser backend, renders pages with a DriverPool of size
+    long-lived drivers.
+    """
+    def __init__(self, size=4, timeout=30, driver_factory=_new_chrome_driver):
+        self._pool = DriverPool(size, timeout, driver_factory)
+
+    def fetch(self, url):
+        driver = self._pool.acquire()
         try:
-            driver = webdriver.Chrome(options=options)
-            driver.implicitly_wait(60)
             driver.get(url)
+            html = driver.page_source
         except:
-            raise RuntimeWarning("Chrome Driver Not Found")
+            self._pool.release(driver, failed=True)
+            raise
+        self._pool.release(driver)
+        return html
+
+    def close(self):
+        self._pool.close()
+
+# Default backends, plain HTTP first and a browser only when that finds no data
+def default_fetchers(workers=4, timeout=30):
+    return [HttpFetcher(pool_size=workers, timeout=timeout),
+            SeleniumFetcher(size=workers, timeout=timeout)]
+
+class PageCache:
+    """
+    Persistent cache of raw history pages in the sqlite file cacheDB,
+    keyed by symbol and date window (period1, period2) and stored
+    zlib-compressed. Windows that end in the past cannot change and
+    are kept for closed_ttl seconds; windows that include today are
+    kept only for open_ttl seconds. When the compressed pages exceed
+    max_bytes the least recently used ones are evicted.
+    Safe to share between fetch threads.
+    """
+    def __init__(self, cacheDB="page_cache.db", max_bytes=64 * 1024 * 1024,
+                 closed_ttl=30 * 86400, open_ttl=900):
+        self._max_bytes = max_bytes
+        self._closed_ttl = closed_ttl
+        self._open_ttl = open_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cacheDB, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                symbol TEXT NOT NULL,
+                                period1 INTEGER NOT NULL,
+                                period2 INTEGER NOT NULL,
+                                page BLOB NOT NULL,
+                                size INTEGER NOT NULL,
+                                expires REAL NOT NULL,
+                                used REAL NOT NULL,
+                                PRIMARY KEY (symbol, period1, period2)
+                            );""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_used ON pages (used);")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT coalesce(sum(size), 0) FROM pages;").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, symbol, period1, period2):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT page, size, expires FROM pages "
+                                     "WHERE symbol=? AND period1=? AND period2=?;",
+                                     (symbol, period1, period2)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[2] <= now:
+                self._conn.execute("DELETE FROM pages WHERE symbol=? AND period1=? AND period2=?;",
+                                   (symbol, period1, period2))
+                self._bytes -= row[1]
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE pages SET used=? WHERE symbol=? AND period1=? AND period2=?;",
+                               (now, symbol, period1, period2))
+            self._conn.commit()
+            self.hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, symbol, period1, period2, html):
+        now = time.time()
+        # the window is still open while its end is in the future
+        ttl = self._open_ttl if int(period2) >= now - 86400 else self._closed_ttl
+        page = zlib.compress(html.encode('utf-8'), 6)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM pages WHERE symbol=? AND period1=? AND period2=?;",
+                                     (symbol, period1, period2)).fetchone()
+            if old is not None:
+                self._bytes -= old[0]
+            self._conn.execute("INSERT OR REPLACE INTO pages VALUES (?,?,?,?,?,?,?);",
+                               (symbol, period1, period2, page, len(page), now + ttl, now))
+            self._bytes += len(page)
+            if self._bytes > self._max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    # Drop expired pages, then least recently used ones until under max_bytes
+    def _evict(self):
+        self._conn.execute("DELETE FROM pages WHERE expires <= ?;", (time.time(),))
+        self._bytes = self._conn.execute("SELECT coalesce(sum(size), 0) FROM pages;").fetchone()[0]
+        if self._bytes <= self._max_bytes:
+            return
+        evict = []
+        for key in self._conn.execute("SELECT rowid, size FROM pages ORDER BY used;"):
+            if self._bytes <= self._max_bytes:
+                break
+            evict.append((key[0],))
+            self._bytes -= key[1]
+        self._conn.executemany("DELETE FROM pages WHERE rowid=?;", evict)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages;")
+            self._conn.commit()
+            self._bytes = 0
+
+    @property
+    def size(self):
+        return self._bytes
 
-        soup = BeautifulSoup(driver.page_source,"html.parser")
-        dataRows = soup.find_all('tr')
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
-        for row in dataRows:
-            td = row.find_all('td')
-            rowList = [i.text for i in td]
-            columnCount = len(rowList)
+    def __enter__(self):
+        return self
 
-            if columnCount == 7:
-                daily_data = DailyData(
-                    datetime.strptime(rowList[0],"%b %d, %Y"),
-                    float(rowList[5].replace(',','')),
-                    float(rowList[6].replace(',',''))
-                )
-                stock.add_data(daily_data)
-                recordCount += 1
+    def __exit__(self, *exc):
+        self.close()
+
+MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+          "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+_historyDayCache = {} # "Mar 03, 2025" -> epoch day, shared by all pages
+
+# Epoch day of a history page date such as "Mar 03, 2025"
+def _history_day(text):
+    day = _historyDayCache.get(text)
+    if day is None:
+        month, dayOfMonth, year = text.replace(',', ' ').split()
+        day = date_to_epoch_day(datetime(int(year), MONTHS[month[:3]], int(dayOfMonth)))
+        _historyDayCache[text] = day
+    return day
+
+# True when a page holds a history table, even one without any rows (a
+# window of weekend days or holidays); pages rendered by script have none
+def has_history_table(html):
+    start = html.find('<table')
+    return start >= 0 and html.rfind('</table>') > start
+
+def parse_history_table(html):
+    """
+    Parse a Yahoo! Finance history page into (days, closes, volumes)
+    columns sorted oldest first, days as epoch days.
+    Only the markup from the first <table> to the last </table> is
+    parsed, and each needed column of the 7-cell price rows is pulled
+    out with one XPath query. Dividend and split rows have fewer cells
+    and are skipped, as are rows without a closing price; a missing
+    volume ("-") is stored as 0.
+    """
+    days = array('i')
+    closes = array('d')
+    volumes = array('d')
+    if not has_history_table(html):
+        return days, closes, volumes
+    start = html.find('<table')
+    end = html.rfind('</table>')
+    import lxml.html
+    table = lxml.html.fragment_fromstring(html[start:end + len('</table>')], create_parent='div')
+    rows = './/tr[count(td)=7]/td[%d]'
+    dateCells = [td.text_content().strip() for td in table.xpath(rows % 1)]
+    closeCells = [td.text_content().strip().replace(',', '') for td in table.xpath(rows % 6)]
+    volumeCells = [td.text_content().strip().replace(',', '') for td in table.xpath(rows % 7)]
+    for dateText, closeText, volumeText in zip(dateCells, closeCells, volumeCells):
+        try:
+            day = _history_day(dateText)
+            close = float(closeText)
+        except (KeyError, ValueError):
+            continue
+        try:
+            volume = float(volumeText)
+        except ValueError:
+            volume = 0.0
+        days.append(day)
+        closes.append(close)
+        volumes.append(volume)
+    # pages list the newest bar first
+    if len(days) > 1 and days[0] > days[-1]:
+        days.reverse()
+        closes.reverse()
+        volumes.reverse()
+    return days, closes, volumes
+
+# Fetch and parse one symbol. A page found in cache is used as is, otherwise
+# each backend is tried in turn, with retries and backoff, until one returns
+# a page with a history table, which is then cached under key. A table
+# without rows means there were no trading days in the window, not that the
+# page needs a browser, so it returns empty columns.
+def _fetch_symbol(fetchers, url, retries, cache=None, key=None):
+    if cache is not None:
+        html = cache.get(*key)
+        if html is not None and has_history_table(html):
+            return parse_history_table(html)
+    error = None
+    for fetcher in fetchers:
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(0.5 * attempt)
+            try:
+                html = fetcher.fetch(url)
+                columns = parse_history_table(html)
+            except Exception as e:
+                error = e
+                continue
+            if len(columns[0]) or has_history_table(html):
+                if cache is not None:
+                    cache.put(*key, html)
+                return columns
+            # page without a table, e.g. needs a browser, try the next backend
+            break
+    if error is not None:
+        raise error
+    return array('i'), array('d'), array('d')
+
+def fetch_stock_history(symbols, dateStart, dateEnd, workers=4, retries=2, timeout=30,
+                        base_url=YAHOO_HISTORY_URL, fetchers=None, cache=None):
+    """
+    Fetch the daily history of many symbols between dateStart and
+    dateEnd (m/d/yy) on a pool of workers threads. fetchers is the list
+    of HistoryFetcher backends tried in order for each symbol (plain
+    HTTP, then Selenium by default), each with up to retries retries.
+    base_url is formatted with symbol, period1 and period2, so a local
+    stub server can stand in for Yahoo! Finance. cache is an optional
+    PageCache serving pages fetched before.
+    Yields (symbol, (days, closes, volumes), error) as each symbol
+    finishes, the columns as returned by parse_history_table and error
+    None on success. Closing the generator cancels symbols not started.
+    """
+    dateFrom = str(int(time.mktime(time.strptime(dateStart,"%m/%d/%y"))))
+    dateTo   = str(int(time.mktime(time.strptime(dateEnd,"%m/%d/%y"))))
+    symbols = list(symbols)
+    if not symbols:
+        return
+    workers = max(1, min(workers, len(symbols)))
+    ownFetchers = fetchers is None
+    if ownFetchers:
+        fetchers = default_fetchers(workers, timeout)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {}
+        for symbol in symbols:
+            url = base_url.format(symbol=symbol, period1=dateFrom, period2=dateTo)
+            futures[executor.submit(_fetch_symbol, fetchers, url, retries, cache,
+                                    (symbol, dateFrom, dateTo))] = symbol
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], (array('i'), array('d'), array('d')), e
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if ownFetchers:
+            for fetcher in fetchers:
+                fetcher.close()
+
+async def fetch_stock_history_async(symbols, dateStart, dateEnd, concurrency=8, retries=2, timeout=30,
+                                    base_url=YAHOO_HISTORY_URL, fetchers=None, cache=None):
+    """
+    asyncio version of fetch_stock_history for callers running an event
+    loop. At most concurrency symbols are in flight, the blocking
+    fetches run in worker threads sharing the fetchers' pooled
+    sessions. Returns {symbol: ((days, closes, volumes), error)}.
+    """
+    dateFrom = str(int(time.mktime(time.strptime(dateStart,"%m/%d/%y"))))
+    dateTo   = str(int(time.mktime(time.strptime(dateEnd,"%m/%d/%y"))))
+    ownFetchers = fetchers is None
+    if ownFetchers:
+        fetchers = default_fetchers(concurrency, timeout)
+    import asyncio
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(symbol):
+        url = base_url.format(symbol=symbol, period1=dateFrom, period2=dateTo)
+        async with semaphore:
+            try:
+                return symbol, (await asyncio.to_thread(_fetch_symbol, fetchers, url, retries, cache,
+                                                        (symbol, dateFrom, dateTo)), None)
+            except Exception as e:
+                return symbol, ((array('i'), array('d'), array('d')), e)
 
-        driver.quit()
+    try:
+        return dict(await asyncio.gather(*(fetch(symbol) for symbol in symbols)))
+    finally:
+        if ownFetchers:
+            for fetcher in fetchers:
+                fetcher.close()
 
+def retrieve_stock_web(dateStart,dateEnd,stock_list,workers=4,retries=2,timeout=30,base_url=YAHOO_HISTORY_URL,fetchers=None,cache=None):
+    """
+    Retrieve daily history for every stock from Yahoo! Finance with
+    fetch_stock_history and merge it into the stocks, reusing pages
+    from the optional PageCache cache.
+    Returns the number of records retrieved. Raises RuntimeWarning
+    naming the symbols that still failed after all retries, after the
+    data of the other symbols has been merged.
+    """
+    recordCount = 0
+    failed = []
+    entered = datetime.now()
+    for symbol, columns, error in fetch_stock_history([stock.symbol for stock in stock_list],
+                                                      dateStart, dateEnd, workers, retries,
+                                                      timeout, base_url, fetchers, cache):
+        if error is not None:
+            failed.append(symbol + " (" + str(error) + ")")
+            continue
+        stock_list.get(symbol).DataList.merge_columns(*columns, entered, 'web')
+        recordCount += len(columns[0])
+    if failed:
+        raise RuntimeWarning("Could not retrieve " + ", ".join(failed))
     return recordCount
 
-def import_stock_web_csv(stock_list, symbol, filename):
+def refresh_stock_history(stock_list, dateEnd=None, dateStart=None, stockDB="stocks.db", workers=4,
+                          retries=2, timeout=30, base_url=YAHOO_HISTORY_URL, fetchers=None, cache=None):
+    """
+    Fetch only the bars newer than the last one stored for each stock,
+    in memory or in stockDB (None to use memory only), up to dateEnd
+    (m/d/yy, default today). Stocks without any data start at
+    dateStart (default one year before dateEnd). Symbols that need the
+    same window are fetched together. cache is an optional PageCache.
+    Yields (symbol, (days, closes, volumes), error) like
+    fetch_stock_history, the columns holding only bars after the
+    stock's last date. Nothing is merged into the stocks.
+    """
+    end = datetime.strptime(dateEnd,"%m/%d/%y") if dateEnd else datetime.now()
+    endDay = date_to_epoch_day(end)
+    # period2 is the midnight after dateEnd, so the window includes that day
+    # and a stock current through yesterday still gets today's bar
+    windowEnd = epoch_day_to_date(endDay + 1).strftime("%m/%d/%y")
+    if dateStart is None:
+        dateStart = (end - timedelta(days=365)).strftime("%m/%d/%y")
+    stored = last_stored_days(stock_list.symbols(), stockDB) if stockDB else {}
+
+    lastDays = {}
+    windows = {} # start date -> symbols needing that window
+    for stock in stock_list:
+        last = _last_day(stock, stored)
+        if last is None:
+            start = dateStart
+        elif last >= endDay:
+            continue
+        else:
+            start = epoch_day_to_date(last + 1).strftime("%m/%d/%y")
+        lastDays[stock.symbol] = last
+        windows.setdefault(start, []).append(stock.symbol)
+
+    ownFetchers = fetchers is None
+    if ownFetchers:
+        fetchers = default_fetchers(workers, timeout)
+    try:
+        for start, symbols in windows.items():
+            history = fetch_stock_history(symbols, start, windowEnd,
+                                          workers, retries, timeout, base_url, fetchers, cache)
+            try:
+                for symbol, columns, error in history:
+                    if error is None:
+                        columns = _newer_than(*columns, lastDays[symbol])
+                    yield symbol, columns, error
+            finally:
+                history.close()
+    finally:
+        if ownFetchers:
+            for fetcher in fetchers:
+                fetcher.close()
+
+def refresh_stock_web(stock_list, dateEnd=None, dateStart=None, stockDB="stocks.db", workers=4,
+                      retries=2, timeout=30, base_url=YAHOO_HISTORY_URL, fetchers=None, cache=None):
+    """
+    Incremental update: merge the bars from refresh_stock_history into
+    the stocks.
+    Returns the number of new bars. Raises RuntimeWarning naming the
+    symbols that failed, after the others have been merged.
+    """
+    recordCount = 0
+    failed = []
+    entered = datetime.now()
+    for symbol, columns, error in refresh_stock_history(stock_list, dateEnd, dateStart, stockDB, workers,
+                                                        retries, timeout, base_url, fetchers, cache):
+        if error is not None:
+            failed.append(symbol + " (" + str(error) + ")")
+            continue
+        recordCount += stock_list.get(symbol).DataList.merge_columns(*columns, entered, 'web')
+    if failed:
+        raise RuntimeWarning("Could not retrieve " + ", ".join(failed))
+    return recordCount
+
+def refresh_stock_db(stock_list, dateEnd=None, dateStart=None, stockDB="stocks.db", workers=4,
+                     retries=2, timeout=30, base_url=YAHOO_HISTORY_URL, fetchers=None, cache=None):
+    """
+    Incremental update straight into stockDB: upsert the bars from
+    refresh_stock_history, committing after each symbol. Stocks whose
+    daily data has not been loaded stay unloaded and nothing is merged
+    into memory, so only the new bars are read and written.
+    Returns a dict with the number of new records and a list of
+    (symbol, error) for the symbols that failed.
+    """
+    result = {"records": 0, "failed": []}
+    conn = connect_database(stockDB)
+    isoCache = {}
+    try:
+        for symbol, columns, error in refresh_stock_history(stock_list, dateEnd, dateStart, stockDB, workers,
+                                                            retries, timeout, base_url, fetchers, cache):
+            if error is not None:
+                result["failed"].append((symbol, str(error)))
+                continue
+            written, changed = _upsert_daily_data(conn.cursor(), symbol, *columns, isoCache)
+            conn.commit()
+            result["records"] += written
+    finally:
+        conn.close()
+    return result
+
+# Drop the bars of sorted columns that are not newer than last
+def _newer_than(days, closes, volumes, last):
+    if last is None:
+        return days, closes, volumes
+    i = bisect_right(days, last)
+    return days[i:], closes[i:], volumes[i:]
+
+# Date formats accepted in CSV files, the first one that parses a sample wins
+CSV_DATE_FORMATS = ("%m/%d/%Y", "%Y-%m-%d", "%m/%d/%y")
+
+# Width and (start, end) of the year, month and day digits of fixed width date formats
+FIXED_DATE_LAYOUTS = {
+    "%m/%d/%Y": (10, (6, 10), (0, 2), (3, 5)),
+    "%Y-%m-%d": (10, (0, 4), (5, 7), (8, 10)),
+}
+
+# Parse fixed width numeric dates straight from their digits, returns epoch days
+# or None when the column does not match the layout
+def _fixed_width_days(rawDates, dateFormat):
+    layout = FIXED_DATE_LAYOUTS.get(dateFormat)
+    if layout is None:
+        return None
+    import numpy as np
+    width, yearSpan, monthSpan, daySpan = layout
+    try:
+        raw = rawDates.to_numpy().astype('S' + str(width))
+    except (UnicodeEncodeError, ValueError):
+        return None
+    digits = raw.view(np.uint8).reshape(-1, width).astype(np.int64) - 48
+
+    def number(span):
+        value = np.zeros(len(digits), dtype=np.int64)
+        for i in range(span[0], span[1]):
+            value = value * 10 + digits[:, i]
+        return value
+
+    spans = (yearSpan, monthSpan, daySpan)
+    positions = [i for span in spans for i in range(*span)]
+    if not ((digits[:, positions] >= 0) & (digits[:, positions] <= 9)).all():
+        return None
+    years, months, days = number(yearSpan), number(monthSpan), number(daySpan)
+    if ((months < 1) | (months > 12) | (days < 1) | (days > 31)).any():
+        return None
+    monthStart = (years - 1970) * 12 + (months - 1)
+    result = (monthStart.astype('datetime64[M]').astype('datetime64[D]')
+              + (days - 1).astype('timedelta64[D]'))
+    # reject days past the end of their month, e.g. 02/30
+    if (result.astype('datetime64[M]').astype(np.int64) != monthStart).any():
+        return None
+    return result.astype(np.int64)
+
+# Convert a text column such as "$229.53" or "202,984,970" to floats in one pass
+def _csv_numbers(column):
+    import pandas as pd
+    if column.dtype == object or str(column.dtype) in ("str", "string"):
+        column = column.astype(str).str.replace(r'[$,\s"]', '', regex=True)
+    return pd.to_numeric(column, errors='coerce')
+
+def read_stock_csv(filename):
+    """
+    Read a Nasdaq or Yahoo! Finance history CSV in one vectorised pass.
+    The date format is inferred once from the first row, fixed width
+    numeric dates are decoded from their digits with numpy, and thousands
+    separators and $ signs are stripped column-wise. Returns the
+    (days, closes, volumes) columns sorted by date with one bar per
+    date, days as epoch days. Rows without a valid date or closing
+    price are dropped, a missing volume is stored as 0.
+    """
+    import numpy as np
+    import pandas as pd
+    with open(filename, newline='') as stockdata:
+        header = [c.strip() for c in next(csv.reader(stockdata), [])]
+    if len(header) < 6:
+        raise ValueError("Not a stock history CSV file: " + str(filename))
+    # Nasdaq files name the close column "Close/Last", older files put it 5th
+    closeIndex = 4
+    for name in ("Close", "Close/Last"):
+        if name in header:
+            closeIndex = header.index(name)
+    volumeIndex = header.index("Volume") if "Volume" in header else 5
+    # only the date, close and volume columns are parsed
+    frame = pd.read_csv(filename, usecols=[0, closeIndex, volumeIndex],
+                        thousands=',', skipinitialspace=True)
+    if frame.empty:
+        return array('i'), array('d'), array('d')
+    frame.columns = [str(c).strip() for c in frame.columns]
+    closeColumn = header[closeIndex]
+    volumeColumn = header[volumeIndex]
+
+    rawDates = frame[header[0]]
+    sample = str(rawDates.iloc[0]).strip()
+    dateFormat = CSV_DATE_FORMATS[0]
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            datetime.strptime(sample, fmt)
+            dateFormat = fmt
+            break
+        except ValueError:
+            continue
+    days = _fixed_width_days(rawDates, dateFormat)
+    if days is not None:
+        validDates = np.ones(len(days), dtype=bool)
+    else:
+        dates = pd.to_datetime(rawDates.astype(str).str.strip(), format=dateFormat, errors='coerce')
+        validDates = dates.notna().to_numpy()
+        days = np.zeros(len(dates), dtype=np.int64)
+        days[validDates] = dates.to_numpy()[validDates].astype('datetime64[D]').astype(np.int64)
+    closes = _csv_numbers(frame[closeColumn])
+    volumes = _csv_numbers(frame[volumeColumn]).fillna(0.0)
+
+    valid = validDates & closes.notna().to_numpy()
+    days = days[valid]
+    closes = closes.to_numpy(dtype=np.float64)[valid]
+    volumes = volumes.to_numpy(dtype=np.float64)[valid]
+    # files list the newest day first, sort oldest first and keep the
+    # last row for any repeated date
+    order = np.argsort(days, kind='stable')
+    days, closes, volumes = days[order], closes[order], volumes[order]
+    keep = np.ones(len(days), dtype=bool)
+    keep[:-1] = days[1:] != days[:-1]
+    days, closes, volumes = days[keep], closes[keep], volumes[keep]
+
+    return (array('i', days.astype(np.int32).tobytes()),
+            array('d', closes.tobytes()),
+            array('d', volumes.tobytes()))
+
+def import_stock_web_csv(stock_list, symbol, filename, incremental=False, stockDB="stocks.db"):
     """
     Import historical data for a single stock from a CSV file in
     Nasdaq format:
     "Date","Open","High","Low","Close","Volume"
     "12/01/2025","233.22","238.97","226.8","229.53","202,984,970"
+    The file is parsed by read_stock_csv and its columns are merged into
+    the stock's series. With incremental=True only rows newer than the
+    stock's last bar (in memory or in stockDB) are merged.
+    Returns the number of new dates added.
     """
-    for stock in stock_list:
-        if stock.symbol.upper() == symbol.upper():
-            with open(filename, newline='') as stockdata:
-                datareader = csv.reader(stockdata, delimiter=',')
-
-                next(datareader)
-
-                for row in datareader:
-                    if len(row) < 6:
-                        continue
-                    raw_date = row[0].strip().strip('"')
-                    date_val = None
-                    for fmt in ("%m/%d/%Y", "%Y-%m-%d", "%m/%d/%y"):
-                        try:
-                            date_val = datetime.strptime(raw_date, fmt)
-                            break
-                        except Exception:
-                            continue
-                    if date_val is None:
-                        # couldn't parse date
-                        continue
-
-                    raw_close = row[4].strip().strip('"')
-                    if raw_close == '' or raw_close.lower() == 'null':
-                        continue
-                    try:
-                        close_val = float(raw_close.replace(',', ''))
-                    except Exception:
-                        continue
-
-                    raw_vol = row[5].strip().strip('"').replace(",", "")
-                    try:
-                        volume_val = float(raw_vol) if raw_vol != '' else 0.0
-                    except Exception:
-                        volume_val = 0.0
-
-                    daily_data = DailyData(date_val, close_val, volume_val)
-                    stock.add_data(daily_data)
+    stock = stock_list.get(symbol)
+    if stock is None:
+        return 0
+    days, closes, volumes = read_stock_csv(filename)
+    if incremental:
+        stored = last_stored_days([stock.symbol], stockDB) if stockDB else {}
+        days, closes, volumes = _newer_than(days, closes, volumes, _last_day(stock, stored))
+    return stock.DataList.merge_columns(days, closes, volumes, datetime.now(), 'csv')
+
+# Symbol for a per-symbol CSV file, e.g. "data/aapl.csv" or "AAPL_history.csv" -> "AAPL"
+def symbol_from_filename(filename):
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.split(r'[_\s]', stem.strip())[0].upper()
+
+# CSV files for a directory, a glob pattern or a single file
+def csv_files(source):
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.csv")))
+    return sorted(glob.glob(source))
+
+# Parse one file for read_stock_csv_files, runs in a worker process
+def _read_stock_csv_job(filename):
+    return (symbol_from_filename(filename),) + read_stock_csv(filename)
+
+def read_stock_csv_files(source, workers=None):
+    """
+    Parse a directory, glob or list of per-symbol history CSVs with
+    read_stock_csv in a process pool of workers processes (all cores by
+    default, workers=1 parses in this process).
+    Yields (filename, (symbol, days, closes, volumes), error) as each
+    file finishes, error is None on success. Closing the generator
+    cancels files not started.
+    """
+    files = csv_files(source) if isinstance(source, str) else list(source)
+    if workers == 1:
+        for filename in files:
+            try:
+                yield filename, _read_stock_csv_job(filename), None
+            except Exception as e:
+                yield filename, None, e
+        return
+    if not files:
+        return
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(_read_stock_csv_job, filename): filename for filename in files}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def import_stock_csv_files(stock_list, source, workers=None, stockDB=None, commit_every=100, incremental=False):
+    """
+    Import a directory or glob of per-symbol history CSVs, the symbol is
+    taken from each file name. Files are parsed by read_stock_csv_files
+    and merged into stock_list as they finish, adding stocks that are
+    not tracked yet. When stockDB is given each
+    stock's rows are also upserted into the database as they arrive,
+    committing every commit_every files; stocks whose daily data has
+    not been loaded yet are not merged, their loader reads the stored
+    rows when they are first used. With incremental=True only
+    rows newer than each stock's last bar are merged and saved.
+    Returns a dict with the number of files imported, new records (new
+    dates merged, or stored in stockDB when given) and a list of
+    (filename, error) for files that failed.
+    """
+    files = csv_files(source)
+    result = {"files": 0, "records": 0, "failed": []}
+    if not files:
+        return result
+    conn = connect_database(stockDB) if stockDB else None
+    isoCache = {}
+    entered = datetime.now()
+    stored = {}
+    if incremental and stockDB:
+        stored = last_stored_days([symbol_from_filename(f) for f in files], stockDB)
+
+    try:
+        for filename, parsed, error in read_stock_csv_files(files, workers):
+            if error is not None:
+                result["failed"].append((filename, str(error)))
+                continue
+            symbol, days, closes, volumes = parsed
+            stock = stock_list.get(symbol)
+            if stock is None:
+                stock = Stock(symbol, symbol, 0)
+                stock_list.add(stock)
+            if incremental:
+                days, closes, volumes = _newer_than(days, closes, volumes, _last_day(stock, stored))
+            if conn is None:
+                result["records"] += stock.DataList.merge_columns(days, closes, volumes, entered, 'csv')
+            else:
+                # stocks not loaded yet read the stored rows when first used
+                if stock.loaded:
+                    stock.DataList.merge_columns(days, closes, volumes, entered, 'csv')
+                cur = conn.cursor()
+                cur.execute(UPSERT_STOCK_CMD, (stock.symbol, stock.name, stock.shares))
+                result["records"] += _upsert_new_days(cur, stock.symbol, days, closes, volumes, isoCache)
+            result["files"] += 1
+            if conn is not None and result["files"] % commit_every == 0:
+                conn.commit()
+        if conn is not None:
+            conn.commit()
+    except:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if conn is not None:
+            conn.close()
+    return result
 
 def main():
     clear_screen()
@@ -1,17 +1,175 @@
 # Summary: This module is just a shorter name for the program that can start either the Console or GUI version of the program.
+# With a command it runs one batch operation without prompts instead and prints the result as JSON,
+# e.g. python stocks.py --db stocks.db refresh
+# Without a command it starts the GUI.
 
-import stock_console
-import stock_GUI
+import argparse
+import json
+import math
+import sys
+from datetime import datetime
+from os import path
+import stock_data
+from stock_class import DailyData, Portfolio
 
-def main():
-    #For Console Version
-    #stock_console.main()
+# Convert results to values json can write: dates as ISO text, NaN as null
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, DailyData):
+        return {"date": _jsonable(value.date), "close": value.close, "volume": value.volume}
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if hasattr(value, "item"):
+        # numpy scalars
+        return _jsonable(value.item())
+    return value
 
-    #For GUI Version
+# Open the portfolio in the database, daily data is loaded when a stock is used
+def _load_portfolio(args):
+    if not path.exists(args.db):
+        stock_data.create_database(args.db)
+    stock_list = Portfolio()
+    stock_data.load_stock_data(stock_list, symbols=_symbols(args), lazy=True, stockDB=args.db)
+    return stock_list
+
+def _symbols(args):
+    symbols = getattr(args, "symbols", None)
+    return [symbol.upper() for symbol in symbols] if symbols else None
+
+# Import a folder or glob of per-symbol CSV files into the database
+def ingest(args):
+    stock_list = _load_portfolio(args)
+    result = stock_data.import_stock_csv_files(stock_list, args.source, workers=args.workers,
+                                               stockDB=args.db, incremental=args.incremental)
+    return result, not result["failed"]
+
+# Retrieve the days newer than the stored history from the web and save them
+def refresh(args):
+    stock_list = _load_portfolio(args)
+    options = {"stockDB": args.db, "workers": args.workers}
+    if args.base_url:
+        options["base_url"] = args.base_url
+    cache = None if args.no_cache else stock_data.PageCache()
+    try:
+        # only the new bars are written, no history is loaded
+        result = stock_data.refresh_stock_db(stock_list, cache=cache, **options)
+    finally:
+        if cache is not None:
+            cache.close()
+    return result, not result["failed"]
+
+# Summary statistics and latest indicators of each stock
+def report(args):
+    import stock_analytics
+    stock_list = _load_portfolio(args)
+    summaries = stock_data.portfolio_summary(stock_list, args.db)
+    indicators = stock_analytics.latest_indicators(stock_list) if args.indicators else {}
+    result = {}
+    for stock in stock_list:
+        result[stock.symbol] = {"name": stock.name, "shares": stock.shares, **summaries[stock.symbol]}
+        if stock.symbol in indicators:
+            result[stock.symbol]["indicators"] = indicators[stock.symbol]
+    return result, True
+
+# Save chart images into a folder
+def export(args):
+    import stock_chart
+    stock_list = _load_portfolio(args)
+    result = stock_chart.export_charts(stock_list, args.directory, _symbols(args), args.format, args.workers, args.db)
+    return result, not result["failed"]
+
+# Run the micro benchmarks
+def bench(args):
+    import stock_bench
+    benches = {
+        "daily_data": lambda: stock_bench.bench_daily_data(args.count),
+        "price_series": lambda: stock_bench.bench_price_series(args.count),
+        "indicators": stock_bench.bench_indicators,
+        "streaming": stock_bench.bench_streaming,
+        "imports": stock_bench.bench_import_time,
+    }
+    names = args.only or list(benches)
+    result = {name: benches[name]() for name in names}
+    # fails when a startup import got slower than its budget
+    return result, all(module["ok"] for module in result.get("imports", {}).values())
+
+def gui(args):
+    import stock_GUI
     stock_GUI.main()
-    return
+    return None, True
+
+def console(args):
+    import stock_console
+    stock_console.main()
+    return None, True
+
+def build_parser():
+    # --db and --indent are accepted before or after the command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default=argparse.SUPPRESS, help="stock database (default stocks.db)")
+    common.add_argument("--indent", type=int, default=argparse.SUPPRESS, help="indent the JSON output")
+    parser = argparse.ArgumentParser(prog="stocks.py", description="Stock Analyzer. Without a command the GUI is started.")
+    parser.add_argument("--db", default="stocks.db", help="stock database (default stocks.db)")
+    parser.add_argument("--indent", type=int, default=None, help="indent the JSON output")
+    commands = parser.add_subparsers(dest="command")
+
+    command = commands.add_parser("ingest", parents=[common], help="import per-symbol CSV files into the database")
+    command.add_argument("source", help="folder or glob of CSV files, the symbol is taken from each file name")
+    command.add_argument("--incremental", action="store_true", help="only add days newer than the stored history")
+    command.add_argument("--workers", type=int, default=None, help="parser processes (default all cores)")
+    command.set_defaults(run=ingest)
+
+    command = commands.add_parser("refresh", parents=[common], help="retrieve new days from the web and save them")
+    command.add_argument("symbols", nargs="*", help="symbols to refresh (default all)")
+    command.add_argument("--workers", type=int, default=4, help="concurrent downloads (default 4)")
+    command.add_argument("--no-cache", action="store_true", help="do not use the page cache")
+    command.add_argument("--base-url", default=None, help="history page URL template")
+    command.set_defaults(run=refresh)
+
+    command = commands.add_parser("report", parents=[common], help="summary statistics and indicators of each stock")
+    command.add_argument("symbols", nargs="*", help="symbols to report (default all)")
+    command.add_argument("--no-indicators", dest="indicators", action="store_false",
+                         help="only the summaries, without loading each history")
+    command.set_defaults(run=report)
+
+    command = commands.add_parser("export", parents=[common], help="save chart images into a folder")
+    command.add_argument("directory", help="folder to save the charts in")
+    command.add_argument("symbols", nargs="*", help="symbols to chart (default all)")
+    command.add_argument("--format", choices=["png", "svg"], default="png")
+    command.add_argument("--workers", type=int, default=None, help="render processes (default all cores)")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser("bench", parents=[common], help="run the micro benchmarks")
+    command.add_argument("--count", type=int, default=200000, help="records for the record benchmarks")
+    command.add_argument("--only", nargs="+", choices=["daily_data", "price_series", "indicators", "streaming", "imports"])
+    command.set_defaults(run=bench)
+
+    command = commands.add_parser("gui", parents=[common], help="start the GUI")
+    command.set_defaults(run=gui)
+    command = commands.add_parser("console", parents=[common], help="start the console menus")
+    command.set_defaults(run=console)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        gui(args)
+        return 0
+    try:
+        result, ok = args.run(args)
+    except Exception as e:
+        result, ok = {"error": str(e)}, False
+    if result is not None:
+        json.dump(_jsonable(result), sys.stdout, indent=args.indent)
+        sys.stdout.write("\n")
+    return 0 if ok else 1
 
 # Program Starts Here
 if __name__ == "__main__":
     # execute only if run as a script
-    main()
\ No newline at end of file
+    sys.exit(main())
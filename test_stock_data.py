@@ -0,0 +1,644 @@
+# Summary: This module contains the tests of stock_data and the daily data it fills, run with
+# python -m pytest or python -m unittest.
+# Web fetching is tested against a local HTTP fixture server and fake browser drivers,
+# so no network, browser or chromedriver is needed.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import stock_data
+from stock_class import date_to_epoch_day
+
+# Fixture URL, the path names the page to serve
+FIXTURE_URL = "http://127.0.0.1:{port}/{{symbol}}?period1={{period1}}&period2={{period2}}"
+
+# Yahoo! Finance style history page with one 7-cell row per (date, close, volume)
+def history_page(rows):
+    cells = "".join("<tr><td>" + date.strftime("%b %d, %Y") + "</td><td>1</td><td>1</td><td>1</td>"
+                    "<td>" + str(close) + "</td><td>" + str(close) + "</td><td>" + format(volume, ",") + "</td></tr>"
+                    for date, close, volume in rows)
+    return ("<html><body><table><thead><tr><th>Date</th></tr></thead><tbody>" + cells +
+            "</tbody></table></body></html>")
+
+PAGE_ROWS = [(datetime(2025, 3, 4), 11.5, 2000), (datetime(2025, 3, 3), 10.5, 1000)]
+# pages rendered by script have no table for the HTTP backend to parse
+SCRIPT_PAGE = "<html><body><div id='app'></div></body></html>"
+
+class FixtureServer:
+    """
+    Local HTTP server standing in for Yahoo! Finance. pages maps a
+    path symbol to a list of (status, html) responses served in turn,
+    the last one repeating. Requests are counted per symbol in hits
+    and the headers of the last one are kept in headers.
+    """
+    def __init__(self):
+        self.pages = {}
+        self.hits = {}
+        self.headers = {}
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                symbol = urlparse(self.path).path.strip("/")
+                with lock:
+                    count = fixture.hits.get(symbol, 0)
+                    fixture.hits[symbol] = count + 1
+                    fixture.headers[symbol] = dict(self.headers)
+                responses = fixture.pages.get(symbol, [(404, "Not Found")])
+                status, html = responses[min(count, len(responses) - 1)]
+                body = html.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = FIXTURE_URL.format(port=self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeDriver:
+    """
+    Stands in for a selenium driver: get() takes delay seconds and then
+    fails with error when given, otherwise page_source is the page
+    passed in.
+    """
+    def __init__(self, page="", error=None, delay=0):
+        self.page_source = page
+        self.error = error
+        self.delay = delay
+        self.urls = []
+        self.quit_called = False
+
+    def get(self, url):
+        self.urls.append(url)
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+    def quit(self):
+        self.quit_called = True
+
+# Driver factory for SeleniumFetcher that starts FakeDrivers and counts them
+def fake_driver_factory(page="", error=None, delay=0):
+    started = []
+
+    def factory(page_timeout):
+        driver = FakeDriver(page, error, delay)
+        started.append(driver)
+        return driver
+    factory.started = started
+    return factory
+
+# Run fetch_stock_history in a thread, failing instead of hanging
+def fetch_all(testCase, *args, **kwargs):
+    result = {}
+
+    def run():
+        for symbol, columns, error in stock_data.fetch_stock_history(*args, **kwargs):
+            result[symbol] = (columns, error)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+    testCase.assertFalse(thread.is_alive(), "fetch_stock_history did not finish")
+    return result
+
+class FetchEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.fixture = FixtureServer()
+
+    def tearDown(self):
+        self.fixture.close()
+
+    def test_fetches_and_parses_pages(self):
+        self.fixture.pages["AAPL"] = [(200, history_page(PAGE_ROWS))]
+        with stock_data.HttpFetcher() as fetcher:
+            result = fetch_all(self, ["AAPL"], "03/01/25", "03/31/25", retries=0,
+                               base_url=self.fixture.url, fetchers=[fetcher])
+        (days, closes, volumes), error = result["AAPL"]
+        self.assertIsNone(error)
+        self.assertEqual(list(days), [date_to_epoch_day(datetime(2025, 3, 3)), date_to_epoch_day(datetime(2025, 3, 4))])
+        self.assertEqual(list(closes), [10.5, 11.5])
+        self.assertEqual(list(volumes), [1000.0, 2000.0])
+
+    def test_retries_until_the_page_is_served(self):
+        self.fixture.pages["AAPL"] = [(500, "busy"), (503, "busy"), (200, history_page(PAGE_ROWS))]
+        with stock_data.HttpFetcher() as fetcher:
+            result = fetch_all(self, ["AAPL"], "03/01/25", "03/31/25", retries=2,
+                               base_url=self.fixture.url, fetchers=[fetcher])
+        self.assertIsNone(result["AAPL"][1])
+        self.assertEqual(len(result["AAPL"][0][0]), 2)
+        self.assertEqual(self.fixture.hits["AAPL"], 3)
+
+    def test_reports_symbols_that_fail_after_all_retries(self):
+        self.fixture.pages["AAPL"] = [(200, history_page(PAGE_ROWS))]
+        with stock_data.HttpFetcher() as fetcher:
+            result = fetch_all(self, ["AAPL", "NOPE"], "03/01/25", "03/31/25", retries=1,
+                               base_url=self.fixture.url, fetchers=[fetcher])
+        self.assertIsNone(result["AAPL"][1])
+        self.assertIsNotNone(result["NOPE"][1])
+        self.assertEqual(len(result["NOPE"][0][0]), 0)
+        self.assertEqual(self.fixture.hits["NOPE"], 2)
+
+    def test_failed_symbols_raise_after_the_others_are_merged(self):
+        from stock_class import Stock, Portfolio
+        self.fixture.pages["AAPL"] = [(200, history_page(PAGE_ROWS))]
+        stock_list = Portfolio()
+        stock_list.add(Stock("AAPL", "Apple", 1))
+        stock_list.add(Stock("NOPE", "Missing", 1))
+        with stock_data.HttpFetcher() as fetcher:
+            with self.assertRaises(RuntimeWarning) as raised:
+                stock_data.retrieve_stock_web("03/01/25", "03/31/25", stock_list, retries=0,
+                                              base_url=self.fixture.url, fetchers=[fetcher])
+        self.assertIn("NOPE", str(raised.exception))
+        self.assertEqual(len(stock_list.get("AAPL").DataList), 2)
+
+class HttpFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.fixture = FixtureServer()
+
+    def tearDown(self):
+        self.fixture.close()
+
+    def test_fetch_returns_the_page(self):
+        self.fixture.pages["AAPL"] = [(200, history_page(PAGE_ROWS))]
+        with stock_data.HttpFetcher() as fetcher:
+            html = fetcher.fetch(self.fixture.url.format(symbol="AAPL", period1=1, period2=2))
+        self.assertEqual(html, history_page(PAGE_ROWS))
+        self.assertEqual(self.fixture.headers["AAPL"]["User-Agent"], stock_data.HttpFetcher.USER_AGENT)
+
+    def test_fetch_raises_on_http_errors(self):
+        with stock_data.HttpFetcher() as fetcher:
+            with self.assertRaises(Exception):
+                fetcher.fetch(self.fixture.url.format(symbol="NOPE", period1=1, period2=2))
+
+    def test_async_fetch(self):
+        import asyncio
+        for symbol in ("A", "B", "C"):
+            self.fixture.pages[symbol] = [(200, history_page(PAGE_ROWS))]
+        with stock_data.HttpFetcher() as fetcher:
+            result = asyncio.run(stock_data.fetch_stock_history_async(
+                ["A", "B", "C", "NOPE"], "03/01/25", "03/31/25", concurrency=2, retries=0,
+                base_url=self.fixture.url, fetchers=[fetcher]))
+        self.assertEqual(sorted(result), ["A", "B", "C", "NOPE"])
+        for symbol in ("A", "B", "C"):
+            columns, error = result[symbol]
+            self.assertIsNone(error)
+            self.assertEqual(list(columns[1]), [10.5, 11.5])
+        self.assertIsNotNone(result["NOPE"][1])
+
+class FallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.fixture = FixtureServer()
+        self.http = stock_data.HttpFetcher()
+
+    def tearDown(self):
+        self.http.close()
+        self.fixture.close()
+
+    def fetch(self, factory, symbols=("AAPL",)):
+        browser = stock_data.SeleniumFetcher(size=1, driver_factory=factory)
+        try:
+            return fetch_all(self, list(symbols), "03/01/25", "03/31/25", retries=0,
+                             base_url=self.fixture.url, fetchers=[self.http, browser])
+        finally:
+            browser.close()
+
+    def test_page_without_table_falls_back_to_the_browser(self):
+        self.fixture.pages["AAPL"] = [(200, SCRIPT_PAGE)]
+        factory = fake_driver_factory(history_page(PAGE_ROWS))
+        columns, error = self.fetch(factory)["AAPL"]
+        self.assertIsNone(error)
+        self.assertEqual(list(columns[1]), [10.5, 11.5])
+        self.assertEqual(len(factory.started), 1)
+
+    def test_http_error_falls_back_to_the_browser(self):
+        factory = fake_driver_factory(history_page(PAGE_ROWS))
+        columns, error = self.fetch(factory, ["NOPE"])["NOPE"]
+        self.assertIsNone(error)
+        self.assertEqual(len(columns[0]), 2)
+
+    def test_empty_table_is_not_a_failure(self):
+        # a window of weekend days or holidays: the table has no rows
+        self.fixture.pages["AAPL"] = [(200, history_page([]))]
+        factory = fake_driver_factory(error=RuntimeWarning("Chrome Driver Not Found"))
+        columns, error = self.fetch(factory)["AAPL"]
+        self.assertIsNone(error)
+        self.assertEqual(len(columns[0]), 0)
+        self.assertEqual(factory.started, [])
+
+    def test_browser_failure_is_reported(self):
+        self.fixture.pages["AAPL"] = [(200, SCRIPT_PAGE)]
+        def factory(page_timeout):
+            raise RuntimeWarning("Chrome Driver Not Found")
+        columns, error = self.fetch(factory)["AAPL"]
+        self.assertIsInstance(error, RuntimeWarning)
+
+    def test_refresh_of_a_current_stock_over_a_weekend(self):
+        from array import array
+        from stock_class import Stock, Portfolio
+        self.fixture.pages["AAPL"] = [(200, history_page([]))]
+        stock_list = Portfolio()
+        stock = Stock("AAPL", "Apple", 1)
+        friday = date_to_epoch_day(datetime(2025, 11, 21))
+        stock.DataList.merge_columns(array('i', [friday]), array('d', [10.0]), array('d', [100.0]))
+        stock_list.add(stock)
+        def factory(page_timeout):
+            raise RuntimeWarning("Chrome Driver Not Found")
+        browser = stock_data.SeleniumFetcher(size=1, driver_factory=factory)
+        try:
+            count = stock_data.refresh_stock_web(stock_list, dateEnd="11/23/25", stockDB=None, retries=0,
+                                                 base_url=self.fixture.url, fetchers=[self.http, browser])
+        finally:
+            browser.close()
+        self.assertEqual(count, 0)
+        # one page over HTTP, the browser was never needed
+        self.assertEqual(self.fixture.hits["AAPL"], 1)
+
+class DriverPoolTest(unittest.TestCase):
+    def test_reuses_drivers(self):
+        factory = fake_driver_factory(history_page(PAGE_ROWS))
+        fetcher = stock_data.SeleniumFetcher(size=2, driver_factory=factory)
+        for _ in range(5):
+            fetcher.fetch("http://fixture/AAPL")
+        fetcher.close()
+        self.assertEqual(len(factory.started), 1)
+        self.assertTrue(factory.started[0].quit_called)
+
+    def test_failed_driver_is_replaced(self):
+        factory = fake_driver_factory(error=IOError("page load failed"))
+        fetcher = stock_data.SeleniumFetcher(size=1, driver_factory=factory)
+        for _ in range(3):
+            with self.assertRaises(IOError):
+                fetcher.fetch("http://fixture/AAPL")
+        fetcher.close()
+        self.assertEqual(len(factory.started), 3)
+        self.assertTrue(all(driver.quit_called for driver in factory.started))
+
+    def test_failed_release_wakes_waiting_threads(self):
+        # one slot, three workers: the waiters must take over the slot each
+        # failed driver frees instead of waiting for an idle driver forever;
+        # the delay makes sure they are waiting before the first one fails
+        factory = fake_driver_factory(error=IOError("page load failed"), delay=0.3)
+        fetcher = stock_data.SeleniumFetcher(size=1, driver_factory=factory)
+        try:
+            result = fetch_all(self, ["A", "B", "C"], "03/01/25", "03/31/25", workers=3, retries=0,
+                               base_url="http://fixture/{symbol}?{period1}{period2}", fetchers=[fetcher])
+        finally:
+            fetcher.close()
+        self.assertEqual(sorted(result), ["A", "B", "C"])
+        self.assertTrue(all(isinstance(error, IOError) for _, error in result.values()))
+
+    def test_failed_driver_start_wakes_waiting_threads(self):
+        def factory(page_timeout):
+            raise RuntimeWarning("Chrome Driver Not Found")
+        fetcher = stock_data.SeleniumFetcher(size=1, driver_factory=factory)
+        try:
+            result = fetch_all(self, ["A", "B", "C"], "03/01/25", "03/31/25", workers=3, retries=0,
+                               base_url="http://fixture/{symbol}?{period1}{period2}", fetchers=[fetcher])
+        finally:
+            fetcher.close()
+        self.assertEqual(sorted(result), ["A", "B", "C"])
+        self.assertTrue(all(isinstance(error, RuntimeWarning) for _, error in result.values()))
+
+class LazyDatabaseUpdateTest(unittest.TestCase):
+    """
+    Refreshing or importing into a database must not load the stored
+    history of lazily loaded stocks.
+    """
+    def setUp(self):
+        from array import array
+        from stock_class import Stock, Portfolio
+        self.fixture = FixtureServer()
+        self.directory = tempfile.TemporaryDirectory()
+        self.stockDB = os.path.join(self.directory.name, "stocks.db")
+        stock_list = Portfolio()
+        stock = Stock("AAPL", "Apple", 10)
+        monday = date_to_epoch_day(datetime(2025, 3, 3))
+        stock.DataList.merge_columns(array('i', [monday - 3, monday]), array('d', [9.5, 10.5]), array('d', [900.0, 1000.0]))
+        stock_list.add(stock)
+        stock_data.save_stock_data(stock_list, self.stockDB)
+        self.stock_list = Portfolio()
+        stock_data.load_stock_data(self.stock_list, lazy=True, stockDB=self.stockDB)
+
+    def tearDown(self):
+        self.fixture.close()
+        self.directory.cleanup()
+
+    def stored_rows(self):
+        conn = sqlite3.connect(self.stockDB)
+        try:
+            return conn.execute("SELECT date, price FROM dailyData ORDER BY date;").fetchall()
+        finally:
+            conn.close()
+
+    def test_refresh_writes_only_the_new_bars(self):
+        self.fixture.pages["AAPL"] = [(200, history_page(PAGE_ROWS))]
+        with stock_data.HttpFetcher() as fetcher:
+            result = stock_data.refresh_stock_db(self.stock_list, dateEnd="03/05/25", stockDB=self.stockDB,
+                                                 retries=0, base_url=self.fixture.url, fetchers=[fetcher])
+        self.assertEqual(result, {"records": 1, "failed": []})
+        self.assertFalse(self.stock_list.get("AAPL").loaded)
+        self.assertEqual(self.stored_rows(), [("2025-02-28", 9.5), ("2025-03-03", 10.5), ("2025-03-04", 11.5)])
+
+    def test_csv_import_leaves_lazy_stocks_unloaded(self):
+        filename = os.path.join(self.directory.name, "AAPL.csv")
+        with open(filename, "w") as csvFile:
+            csvFile.write("Date,Open,High,Low,Close,Volume\n03/05/2025,1,1,1,12.5,3000\n03/04/2025,1,1,1,11.5,2000\n")
+        result = stock_data.import_stock_csv_files(self.stock_list, filename, workers=1,
+                                                   stockDB=self.stockDB, incremental=True)
+        self.assertEqual(result["records"], 2)
+        aapl = self.stock_list.get("AAPL")
+        self.assertFalse(aapl.loaded)
+        self.assertEqual(self.stored_rows()[-2:], [("2025-03-04", 11.5), ("2025-03-05", 12.5)])
+        # the loader finds the imported rows
+        self.assertEqual(list(aapl.DataList.closes), [9.5, 10.5, 11.5, 12.5])
+
+    def test_csv_import_counts_new_dates_whether_loaded_or_not(self):
+        filename = os.path.join(self.directory.name, "AAPL.csv")
+        with open(filename, "w") as csvFile:
+            # one changed price on a stored date and one new date
+            csvFile.write("Date,Open,High,Low,Close,Volume\n03/03/2025,1,1,1,10.0,1000\n03/04/2025,1,1,1,11.5,2000\n")
+        counts = []
+        for load in (False, True):
+            stock_data.load_stock_data(self.stock_list, lazy=True, stockDB=self.stockDB)
+            if load:
+                self.stock_list.get("AAPL").DataList
+            result = stock_data.import_stock_csv_files(self.stock_list, filename, workers=1, stockDB=self.stockDB)
+            counts.append(result["records"])
+            self.delete_day("2025-03-04")
+        self.assertEqual(counts, [1, 1])
+
+    def delete_day(self, isoDate):
+        conn = sqlite3.connect(self.stockDB)
+        try:
+            conn.execute("DELETE FROM dailyData WHERE date = ?;", (isoDate,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def test_writer_stores_bars_of_lazy_stocks_only(self):
+        from array import array
+        monday = date_to_epoch_day(datetime(2025, 3, 3))
+        columns = (array('i', [monday, monday + 1]), array('d', [10.5, 11.5]), array('d', [1000.0, 2000.0]))
+        with stock_data.DailyDataWriter(self.stock_list, self.stockDB) as writer:
+            self.assertEqual(writer.store("AAPL", *columns), 1)
+            self.assertEqual(writer.store("MSFT", *columns), None)
+            aapl = self.stock_list.get("AAPL")
+            self.assertFalse(aapl.loaded)
+            self.assertEqual(self.stored_rows()[-1], ("2025-03-04", 11.5))
+            # once loaded the bars are left to be merged
+            self.assertEqual(list(aapl.DataList.closes), [9.5, 10.5, 11.5])
+            self.assertEqual(writer.store("AAPL", *columns), None)
+
+    def test_chart_snapshot_reads_lazy_stocks_from_the_database(self):
+        import stock_chart
+        snapshot = stock_data.stock_snapshot(self.stock_list)
+        charts = list(stock_chart.snapshot_charts(snapshot, self.stockDB))
+        self.assertFalse(self.stock_list.get("AAPL").loaded)
+        symbol, title, days, closes = charts[0]
+        self.assertEqual((symbol, title, list(closes)), ("AAPL", "AAPL - Apple", [9.5, 10.5]))
+        self.assertEqual(list(days), list(self.stock_list.get("AAPL").DataList.dates))
+
+class SaveSnapshotTest(unittest.TestCase):
+    def test_snapshot_is_not_changed_by_later_edits(self):
+        from stock_class import Stock, Portfolio, DailyData
+        with tempfile.TemporaryDirectory() as directory:
+            stockDB = os.path.join(directory, "stocks.db")
+            stock_list = Portfolio()
+            stock = Stock("AAPL", "Apple", 10)
+            stock.add_data(DailyData(datetime(2025, 3, 4), 11.5, 2000.0))
+            stock_list.add(stock)
+            snapshot = stock_data.stock_snapshot(stock_list)
+            # an earlier day inserted in front of the copied rows
+            stock.add_data(DailyData(datetime(2025, 3, 3), 10.5, 1000.0))
+            result = stock_data.save_stock_snapshot(snapshot, stockDB)
+            conn = sqlite3.connect(stockDB)
+            try:
+                rows = conn.execute("SELECT symbol, date, price, volume FROM dailyData;").fetchall()
+            finally:
+                conn.close()
+        self.assertEqual(result["inserted"], 1)
+        self.assertEqual(rows, [("AAPL", "2025-03-04", 11.5, 2000.0)])
+
+# Original (version 0) schema, dates stored as %m/%d/%y text
+V0_SCHEMA = ("""CREATE TABLE stocks (
+                    symbol TEXT NOT NULL PRIMARY KEY,
+                    name TEXT,
+                    shares REAL
+                );""",
+             """CREATE TABLE dailyData (
+                    symbol TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    volume REAL NOT NULL,
+                    PRIMARY KEY (symbol, date)
+                );""")
+V0_ROWS = [("AAPL", "03/04/25", 11.5, 2000.0), ("AAPL", "03/03/25", 10.5, 1000.0),
+           ("AAPL", "12/31/99", 1.25, 10.0), ("MSFT", "01/02/25", 400.0, 500.0)]
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stockDB = os.path.join(self.directory.name, "stocks.db")
+        conn = sqlite3.connect(self.stockDB)
+        for command in V0_SCHEMA:
+            conn.execute(command)
+        conn.executemany("INSERT INTO stocks VALUES (?,?,?);", [("AAPL", "Apple", 10.0), ("MSFT", "Microsoft", 5.0)])
+        conn.executemany("INSERT INTO dailyData VALUES (?,?,?,?);", V0_ROWS)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # schema sql, user_version, stocks and daily rows of the database
+    def snapshot(self, conn):
+        schema = conn.execute("SELECT sql FROM sqlite_master WHERE name='dailyData';").fetchone()[0]
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+        stocks = conn.execute("SELECT * FROM stocks ORDER BY symbol;").fetchall()
+        rows = conn.execute("SELECT * FROM dailyData ORDER BY symbol, date;").fetchall()
+        return schema, version, stocks, rows
+
+    def test_migrates_version_0(self):
+        conn = stock_data.connect_database(self.stockDB)
+        try:
+            schema, version, stocks, rows = self.snapshot(conn)
+        finally:
+            conn.close()
+        self.assertEqual(version, 1)
+        self.assertIn("WITHOUT ROWID", schema)
+        self.assertEqual(stocks, [("AAPL", "Apple", 10.0), ("MSFT", "Microsoft", 5.0)])
+        self.assertEqual(rows, [("AAPL", "1999-12-31", 1.25, 10.0), ("AAPL", "2025-03-03", 10.5, 1000.0),
+                                ("AAPL", "2025-03-04", 11.5, 2000.0), ("MSFT", "2025-01-02", 400.0, 500.0)])
+
+    def test_migrating_again_changes_nothing(self):
+        stock_data.connect_database(self.stockDB).close()
+        conn = sqlite3.connect(self.stockDB)
+        try:
+            before = self.snapshot(conn)
+            self.assertEqual(stock_data.migrate_database(conn), 1)
+            self.assertEqual(conn.total_changes, 0)
+            self.assertEqual(self.snapshot(conn), before)
+        finally:
+            conn.close()
+
+    def test_migrated_data_loads(self):
+        from stock_class import Portfolio
+        stock_list = Portfolio()
+        stock_data.load_stock_data(stock_list, stockDB=self.stockDB)
+        aapl = stock_list.get("AAPL")
+        self.assertEqual([d.date for d in aapl.DataList],
+                         [datetime(1999, 12, 31), datetime(2025, 3, 3), datetime(2025, 3, 4)])
+        self.assertEqual(aapl.shares, 10.0)
+
+    def test_new_database_starts_at_the_current_version(self):
+        newDB = os.path.join(self.directory.name, "new.db")
+        stock_data.create_database(newDB)
+        conn = sqlite3.connect(newDB)
+        try:
+            schema, version, stocks, rows = self.snapshot(conn)
+        finally:
+            conn.close()
+        self.assertEqual(version, stock_data.SCHEMA_VERSION)
+        self.assertIn("WITHOUT ROWID", schema)
+        self.assertEqual((stocks, rows), ([], []))
+
+class PriceSeriesTest(unittest.TestCase):
+    """
+    Randomized check of PriceSeries against a dict of the expected bars,
+    covering the append, bar by bar and full merge paths of merge, the
+    de-duplication of unsorted batches and the running summary totals.
+    """
+    def assertMatches(self, series, expected):
+        days = sorted(expected)
+        self.assertEqual(list(series.dates), days)
+        self.assertEqual(list(series.closes), [expected[day][0] for day in days])
+        self.assertEqual(list(series.volumes), [expected[day][1] for day in days])
+        summary = series.summary()
+        self.assertEqual(summary["count"], len(days))
+        if not days:
+            self.assertEqual((summary["average"], summary["min"], summary["max"]), (None, None, None))
+            return
+        closes = [expected[day][0] for day in days]
+        self.assertAlmostEqual(summary["average"], sum(closes) / len(closes), places=6)
+        self.assertEqual((summary["min"], summary["max"]), (min(closes), max(closes)))
+        self.assertAlmostEqual(summary["volume"], sum(expected[day][1] for day in days), places=3)
+        self.assertEqual(date_to_epoch_day(summary["first"].date), days[0])
+        self.assertEqual(summary["last"].close, closes[-1])
+
+    def test_random_edits_match_a_dict_of_bars(self):
+        import random
+        from array import array
+        from stock_class import PriceSeries
+        rand = random.Random(7)
+        series = PriceSeries()
+        expected = {}
+
+        def bar():
+            return round(rand.uniform(1, 100), 2), float(rand.randrange(1, 10000))
+
+        def merge(days):
+            closes = array('d')
+            volumes = array('d')
+            new = set()
+            for day in days:
+                close, volume = bar()
+                closes.append(close)
+                volumes.append(volume)
+                if day not in expected:
+                    new.add(day)
+                # the last bar for a day wins
+                expected[day] = (close, volume)
+            self.assertEqual(series.merge_columns(array('i', days), closes, volumes), len(new))
+
+        merge(list(range(0, 400, 2)))
+        for step in range(300):
+            last = max(expected) if expected else 0
+            kind = rand.randrange(5)
+            if kind == 0:
+                day = rand.randrange(-50, last + 50)
+                close, volume = bar()
+                self.assertEqual(series.add_values(day, close, volume), day not in expected)
+                expected[day] = (close, volume)
+            elif kind == 1:
+                # after the last stored date
+                merge([last + 1 + i for i in range(rand.randrange(1, 20))])
+            elif kind == 2:
+                # small batch, inserted bar by bar
+                merge([rand.randrange(-20, last + 20) for _ in range(rand.randrange(1, 6))])
+            elif kind == 3:
+                # large unsorted batch with duplicates, merged in one pass
+                merge([rand.randrange(-20, last + 20) for _ in range(rand.randrange(len(expected) // 4, len(expected)))])
+            else:
+                day = rand.choice([min(expected, key=lambda d: expected[d][0]),
+                                   max(expected, key=lambda d: expected[d][0]),
+                                   rand.randrange(-50, last + 50)])
+                self.assertEqual(series.remove_day(day), expected.pop(day, None) is not None)
+            self.assertMatches(series, expected)
+        for day in list(expected):
+            series.remove_day(day)
+            del expected[day]
+        self.assertMatches(series, expected)
+
+class StreamingIndicatorsTest(unittest.TestCase):
+    """
+    Indicators kept up to date bar by bar must match latest_indicators
+    computed from the whole series after every appended bar.
+    """
+    def assertSameIndicators(self, stock):
+        import math
+        import stock_analytics
+        streamed = stock.indicators.values()
+        computed = stock_analytics.latest_indicators([stock])[stock.symbol]
+        self.assertEqual(sorted(streamed), sorted(computed))
+        for name, value in computed.items():
+            if math.isnan(value):
+                self.assertTrue(math.isnan(streamed[name]), name + " after " + str(len(stock.DataList)) + " bars")
+            else:
+                self.assertTrue(math.isclose(streamed[name], value, rel_tol=1e-6, abs_tol=1e-6),
+                                name + " after " + str(len(stock.DataList)) + " bars: "
+                                + str(streamed[name]) + " != " + str(value))
+
+    def appended_bars(self, seed):
+        import random
+        from array import array
+        from stock_class import Stock, DailyData, epoch_day_to_date
+        rand = random.Random(11)
+        close = 100.0
+        bars = []
+        for day in range(150):
+            close = max(1.0, close * (1 + rand.gauss(0, 0.02)))
+            bars.append((day, round(close, 2), float(rand.randrange(1000, 100000))))
+        stock = Stock("AAPL", "Apple", 10)
+        days, closes, volumes = zip(*bars[:seed])
+        stock.DataList.merge_columns(array('i', days), array('d', closes), array('d', volumes))
+        # seeds the state from the vectorised indicators
+        self.assertSameIndicators(stock)
+        for day, close, volume in bars[seed:]:
+            stock.add_data(DailyData(epoch_day_to_date(day), close, volume))
+            self.assertSameIndicators(stock)
+
+    def test_appended_bars_match_latest_indicators(self):
+        self.appended_bars(60)
+
+    def test_bars_appended_from_the_first_match_latest_indicators(self):
+        self.appended_bars(1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -38,11 +38,7 @@ def sortDailyData(stock_list):
 # Function to create stock chart
 def display_stock_chart(stock_list,symbol):
     # Find the stock
-    target = None
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            target = stock
-            break
+    target = stock_list.get(symbol)
     if target is None:
         print("Stock not found: ", symbol)
         return
@@ -51,20 +47,67 @@ def display_stock_chart(stock_list,symbol):
         print("No data to display for:", symbol)
         return
 
-    dates = [d.date for d in target.DataList]
-    prices = [d.close for d in target.DataList]
     # import matplotlib only when charting to avoid heavy imports at module import time
     try:
         import matplotlib.pyplot as plt
     except Exception as e:
         print("Plotting unavailable (matplotlib not installed or import failed):", e)
         return
+    import numpy as np
+    from stock_chart import chart_dates, decimate_minmax
 
+    # one low and one high point per pixel of the 800 pixel wide figure
+    dates, prices = decimate_minmax(chart_dates(target.DataList.dates),
+                                    np.array(target.DataList.closes), 800)
     plt.figure(figsize=(8,4))
-    plt.plot(dates, prices, marker='o')
+    plt.plot(dates, prices, linewidth=1)
+    plt.gca().xaxis_date()
     plt.title(f"{target.symbol} - {target.name}")
     plt.xlabel('Date')
     plt.ylabel('Price')
     plt.grid(True)
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+# Function to chart every stock's change since its first close on one set of axes
+def display_performance_chart(stock_list):
+    if not any(stock.DataList for stock in stock_list):
+        print("No data to display")
+        return
+    import stock_analytics
+    frame = stock_analytics.normalised_performance(stock_analytics.align_closes(stock_list)) * 100.0
+    _display_frame_chart("Performance", frame, "Change %")
+
+# Function to chart the total value of the portfolio over time
+def display_portfolio_chart(stock_list):
+    if not any(stock.DataList for stock in stock_list):
+        print("No data to display")
+        return
+    import stock_analytics
+    _display_frame_chart("Portfolio Value", stock_analytics.portfolio_value(stock_list), "Value")
+
+# Draw each column of a date indexed frame as one decimated line
+def _display_frame_chart(title, frame, ylabel):
+    try:
+        import matplotlib.pyplot as plt
+    except Exception as e:
+        print("Plotting unavailable (matplotlib not installed or import failed):", e)
+        return
+    import numpy as np
+    from stock_chart import frame_lines, decimate_minmax, LEGEND_LINES
+
+    dates, columns = frame_lines(frame)
+    plt.figure(figsize=(8,4))
+    for label, values in columns:
+        present = ~np.isnan(values)
+        x, y = decimate_minmax(dates[present], values[present], 800)
+        plt.plot(x, y, linewidth=1, label=label)
+    if 1 < len(columns) <= LEGEND_LINES:
+        plt.legend(loc='upper left', fontsize='small')
+    plt.gca().xaxis_date()
+    plt.title(title)
+    plt.xlabel('Date')
+    plt.ylabel(ylabel)
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()